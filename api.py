@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""OAuth callback, token API and storage without the NiceGUI interface.
+
+app.py mounts these routes under the UI; run this module directly for a
+headless deployment that only serves /callback, the token API and /metrics:
+
+    python api.py
+"""
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import httpx
+from fastapi import APIRouter, FastAPI, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from clio_oauth import ClioOAuthClient
+from clio_regions import DEFAULT_REGION, endpoints, is_valid_region
+from token_store import open_store, GRID_FIELDS
+from oauth_state import OAuthStateStore
+from refresh_scheduler import RefreshScheduler
+from token_cache import TokenCache
+from token_health import TokenHealthChecker
+from token_broker import TokenBroker, STRATEGIES
+from token_reaper import TokenReaper
+from event_feed import EventFeed
+from gateway_model import GatewayModel
+from grid_model import GRID_ENDPOINT
+from bulk_io import EXPORT_FIELDS, FORMATS, export_lines, import_stream
+from journal import Journal, JOURNAL_DIR, acting_as
+from metrics import REGISTRY, CONTENT_TYPE, CALLBACK_LATENCY, EventLoopMonitor, Gauge
+
+# Endpoints of the default region; each gateway's Region column selects its own (see clio_regions.py).
+# AUTH_BASE_URL, TOKEN_URL, DEAUTHORIZE_URL and PROBE_URL can override them (e.g. to point at a local mock server)
+AUTH_BASE_URL, TOKEN_URL, DEAUTHORIZE_URL, PROBE_URL = endpoints(DEFAULT_REGION)
+
+HOST = os.getenv("HOST", "127.0.0.1")
+PORT = int(os.getenv("PORT", 8080))
+
+# Must match the redirect URI registered with Clio for every gateway (one callback serves all regions).
+# A wildcard bind address (e.g. HOST=0.0.0.0 in containers) is not a URL Clio can redirect to, so the
+# default then stays on 127.0.0.1; set REDIRECT_URI to the address browsers actually use
+WILDCARD_HOSTS = ("0.0.0.0", "::", "[::]", "")
+REDIRECT_URI = os.getenv("REDIRECT_URI", f"http://{'127.0.0.1' if HOST in WILDCARD_HOSTS else HOST}:{PORT}/callback")
+
+# Set to a file path (e.g. ".nicegui/oauth_states.json") to keep pending logins across restarts
+OAUTH_STATE_FILE = os.getenv("OAUTH_STATE_FILE")
+
+# "local": SQLite file and in-memory OAuth states for a single process
+# "sqlite": SQLite file shared by several workers on one host, with OAuth states and change notifications in it
+# "redis": Redis at REDIS_URL, for workers on several hosts ("fakeredis://" runs an in-process fake)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Tokens issued longer ago than this many days are deauthorized and purged (unset: only expired tokens)
+TOKEN_MAX_AGE_DAYS = os.getenv("TOKEN_MAX_AGE_DAYS")
+
+# Shared connection pool for every call to the Clio OAuth endpoints
+oauth_client = ClioOAuthClient()
+
+token_store = open_store(STORAGE_BACKEND, redis_url=REDIS_URL)
+
+# Pending OAuth state tokens are held in memory and expire after 60 seconds
+# Shared backends keep OAuth states too, so a callback can land on any worker
+oauth_states = OAuthStateStore(persist_path=OAUTH_STATE_FILE, backend=token_store if token_store.shared else None)
+
+# Renews stored tokens a configurable margin before they expire, each at its own region
+refresh_scheduler = RefreshScheduler(token_store, oauth_client)
+
+# Current token per gateway for the token-vending API, invalidated by store changes
+token_cache = TokenCache(token_store)
+
+# Deauthorizes and purges expired and over-age tokens in the background
+token_reaper = TokenReaper(token_store, oauth_client,
+                           max_age=float(TOKEN_MAX_AGE_DAYS) * 86400 if TOKEN_MAX_AGE_DAYS else None)
+
+# Probes every stored token against Clio, reusing results younger than the health TTL
+health_checker = TokenHealthChecker(token_store, oauth_client)
+
+# Gateway grid columns and rows, built once per data version and shared by every session
+gateway_model = GatewayModel(token_store)
+
+# Spreads downstream jobs over every token of a gateway within Clio's per-token rate limits
+token_broker = TokenBroker(token_store)
+
+# Token issued/refreshed/invalid/revoked events streamed to downstream services over SSE
+event_feed = EventFeed(token_store)
+
+# Append-only audit trail of gateway and token lifecycle events; each worker needs its own directory
+JOURNAL_DIRECTORY = os.getenv("JOURNAL_DIR") or JOURNAL_DIR
+# Opened by startup(), so only the serving process locks it (not NiceGUI's reload parent or the bulk_io CLI)
+journal: Optional[Journal] = None
+
+# Event loop lag, so blocking calls on the loop show up in /metrics
+loop_monitor = EventLoopMonitor()
+
+# Gauges are computed only when /metrics is scraped
+REGISTRY.register(Gauge("clio_stored_tokens", "Stored access tokens per API gateway.", ["api_gateway"],
+                        lambda: {(name,): count for name, count in token_store.token_counts().items()}))
+REGISTRY.register(Gauge("clio_pending_oauth_states", "OAuth flows waiting for their callback.", [],
+                        lambda: {(): len(oauth_states)}))
+REGISTRY.register(Gauge("clio_event_subscribers", "Open /events streams.", [],
+                        lambda: {(): event_feed.subscribers}))
+REGISTRY.register(Gauge("clio_token_leases_in_flight", "Token leases not yet released per API gateway.", ["api_gateway"],
+                        lambda: {(name,): count for name, count in token_broker.in_flight().items()}))
+
+
+def region_token_urls() -> set:
+    """Token endpoints of the default region and of every region a stored gateway uses."""
+    regions = {gateway["region"] for gateway in token_store.gateways() if is_valid_region(gateway["region"])}
+    return {TOKEN_URL} | {endpoints(region).token_url for region in regions}
+
+
+async def startup() -> None:
+    global journal
+    if journal is None:
+        # Workers sharing the default directory each journal to their own worker-N subdirectory
+        journal = Journal(token_store, JOURNAL_DIRECTORY, per_worker=not os.getenv("JOURNAL_DIR"))
+    # One keep-alive pool per region, connected in the background so startup is not delayed
+    await oauth_client.start(warm_urls=region_token_urls())
+    await token_store.start()
+    await oauth_states.start()
+    await refresh_scheduler.start()
+    await journal.start()
+    await loop_monitor.start()
+    await token_reaper.start()
+
+
+async def shutdown() -> None:
+    await loop_monitor.stop()
+    await token_reaper.stop()
+    await refresh_scheduler.stop()
+    if journal is not None:
+        await journal.stop()
+    await oauth_states.stop()
+    await token_store.stop()
+    await oauth_client.close()
+    token_store.close()
+
+
+router = APIRouter()
+
+@router.get("/callback")
+async def callback(request: Request):
+    """Handle OAuth callback and record its end-to-end duration."""
+    start = time.perf_counter()
+    result = await handle_callback(request)
+    CALLBACK_LATENCY.observe(time.perf_counter() - start, "success" if result == "Success" else "error")
+    return result
+
+async def handle_callback(request: Request):
+    """Validate state and request access token."""
+    query_params = request.query_params
+    code = query_params.get("code")
+    state = query_params.get("state")
+
+    if not code or not state:
+        return "Invalid request: Missing code or state."
+
+    # State token set to expire after 60 seconds
+    # Removes state token before completing callback
+    state_data = oauth_states.consume(state)
+
+    if not state_data:
+        return "Invalid or expired state."
+
+    client_id = state_data.get("client_id")
+    client_secret = state_data.get("client_secret")
+    api_gateway = state_data.get("api_gateway")  # Retrieve API Gateway name
+    gateway_id = state_data.get("gateway_id")
+    region = state_data.get("region")
+
+    if not client_id or not client_secret:
+        return "Stored client credentials missing. Please restart authentication."
+
+    payload = {
+        "client_id": client_id,
+        "client_secret": client_secret,
+        "grant_type": "authorization_code",
+        "code": code,
+        "redirect_uri": REDIRECT_URI
+    }
+    try:
+        # Authorization codes are single-use, so a sent exchange is never repeated
+        response = await oauth_client.post(endpoints(region).token_url, data=payload, idempotent=False)
+    except httpx.HTTPError:
+        return "Error"
+
+    if response.status_code == 200:
+        token_data = response.json()
+        access_token = token_data.get("access_token")
+        expires_in = token_data.get("expires_in")
+
+        # Store access token as a single-row insert; the refresh scheduler picks it up from the store
+        with acting_as("oauth_callback"):
+            token_store.add_token(
+                api_gateway,
+                access_token,
+                gateway_id,
+                refresh_token=token_data.get("refresh_token"),
+                expires_at=time.time() + expires_in if expires_in else None,
+                region=region,
+            )
+        return "Success"
+
+    else:
+        return "Error"
+
+@router.get("/api/tokens/{api_gateway}")
+async def vend_token(api_gateway: str, request: Request):
+    """Return the current access token for an API gateway from the in-memory cache."""
+    entry = token_cache.get(api_gateway)
+    if entry is None:
+        return JSONResponse({"error": f"No access token for API gateway: {api_gateway}"}, status_code=404)
+
+    body, etag = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+@router.post("/api/tokens/{api_gateway}/lease")
+async def lease_token(api_gateway: str, requests: int = 1, strategy: str = "round_robin"):
+    """Lease one of the gateway's tokens with budget for `requests` calls; 429 with Retry-After when all are exhausted."""
+    if strategy not in STRATEGIES or not 1 <= requests <= token_broker.rate_limit:
+        return JSONResponse({"error": f"Invalid strategy or request count: {strategy}, {requests}"}, status_code=400)
+
+    lease, retry_after = token_broker.lease(api_gateway, requests, strategy)
+    if lease is None:
+        if not retry_after:
+            return JSONResponse({"error": f"No access token for API gateway: {api_gateway}"}, status_code=404)
+        return JSONResponse({"error": "Every token of this API gateway is at its rate limit"}, status_code=429,
+                            headers={"Retry-After": str(math.ceil(retry_after))})
+    return lease
+
+@router.post("/api/leases/{lease_id}/release")
+async def release_lease(lease_id: str, request: Request):
+    """End a lease; the body may report Clio's X-RateLimit-Remaining and Retry-After for the token."""
+    try:
+        report = await request.json() if await request.body() else {}
+        if not isinstance(report, dict):
+            raise ValueError("The body must be a JSON object")
+        released = token_broker.release(lease_id, report.get("rate_limit_remaining"), report.get("retry_after"))
+    except ValueError as error:
+        # Bad reports are rejected before the lease ends, so the client can retry with corrected values
+        return JSONResponse({"error": str(error)}, status_code=400)
+    if not released:
+        return JSONResponse({"error": f"Unknown or expired lease: {lease_id}"}, status_code=404)
+    return Response(status_code=204)
+
+@router.get("/events")
+async def token_events(request: Request, api_gateway: Optional[List[str]] = Query(None), last_event_id: Optional[str] = None):
+    """Stream token events as Server-Sent Events, optionally for some gateways, resuming after Last-Event-ID."""
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    return StreamingResponse(event_feed.stream(api_gateway or (), resume_from), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.post("/api/tokens/validate")
+async def validate_tokens(force: bool = False):
+    """Health-check stored tokens (skipping recently checked ones unless forced) and return counts per status."""
+    return await health_checker.validate_all(force=force)
+
+@router.get("/api/export/{table}")
+async def export_table(table: str, format: str = "jsonl"):
+    """Stream every gateway or token as JSONL or CSV."""
+    if table not in EXPORT_FIELDS or format not in FORMATS:
+        return JSONResponse({"error": f"Unknown table or format: {table}, {format}"}, status_code=404)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="{table}.{format}"'}
+    return StreamingResponse(export_lines(token_store, table, format), media_type=media_type, headers=headers)
+
+@router.post("/api/import/{table}")
+async def import_table(table: str, request: Request, format: str = "jsonl"):
+    """Import gateways or tokens from a streamed JSONL or CSV body, skipping duplicates and invalid rows."""
+    if table not in EXPORT_FIELDS or format not in FORMATS:
+        return JSONResponse({"error": f"Unknown table or format: {table}, {format}"}, status_code=404)
+    with acting_as(f"import:{request.client.host if request.client else 'unknown'}"):
+        return await import_stream(token_store, table, request.stream(), format)
+
+@router.get("/api/journal")
+async def journal_events(table: str = None, row_id: int = None, since: float = None, until: float = None,
+                         after: int = 0, limit: int = 100):
+    """Return journaled lifecycle events in order; pass the last seq as `after` to fetch the next page."""
+    if table is not None and table not in GRID_FIELDS:
+        return JSONResponse({"error": f"Unknown table: {table}"}, status_code=404)
+    events = list(itertools.islice(journal.events(table, row_id, since, until, after_seq=after), max(1, min(limit, 1000))))
+    return {"events": events, "next": events[-1]["seq"] if events else after}
+
+@router.get("/metrics")
+async def metrics():
+    """Expose latency histograms and store gauges in Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@router.post(GRID_ENDPOINT)
+async def grid_rows(table: str, request: Request):
+    """Return one sorted and filtered window of rows for a server-side paginated grid."""
+    if table not in GRID_FIELDS:
+        return JSONResponse({"error": f"Unknown table: {table}"}, status_code=404)
+
+    params = await request.json()
+    window = (int(params.get("startRow", 0)), int(params.get("endRow", 0)), params.get("sortModel"), params.get("filterModel"))
+    if table == "api_gateways":
+        rows, last_row = gateway_model.page(*window)
+    else:
+        rows, last_row = token_store.page(table, *window)
+    return {"rows": rows, "lastRow": last_row}
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    await startup()
+    yield
+    await shutdown()
+
+
+def create_app() -> FastAPI:
+    """Build a FastAPI app serving only the API routes, for headless deployments and test fixtures."""
+    headless = FastAPI(title="Clio Access Token Manager", lifespan=lifespan)
+    headless.include_router(router)
+    return headless
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(create_app(), host=HOST, port=PORT)
@@ -1,124 +1,56 @@
 #!/usr/bin/env python3
-import secrets
-import time
-import httpx
+import io
+import tempfile
 from urllib.parse import urlencode
 
-from nicegui import ui, app
-from fastapi import Request
+from nicegui import Client, ui, app
 
+from api import (router as api_router, startup, shutdown, oauth_client, token_store, oauth_states, health_checker,
+                 gateway_model, HOST, PORT, REDIRECT_URI)
 from page_router import Router
+from clio_oauth import DEAUTHORIZE_CONCURRENCY, PROBE_CONCURRENCY
+from clio_regions import DEFAULT_REGION, REGION_BASE_URLS, endpoints, is_valid_region
+from write_buffer import RowWriteBuffer
+from grid_model import infinite_grid_options, apply_changes
+from token_store import GRID_FIELDS
+from change_bus import ChangeBus
+from bulk_io import import_lines
+from journal import acting_as
+from metrics import REGISTRY, Gauge
+
+# Number of visited pages kept alive per browser tab (0 rebuilds a page on every navigation)
+PAGE_CACHE_SIZE = 2
 
-AUTH_BASE_URL = "https://app.clio.com/oauth/authorize"
-TOKEN_URL = "https://app.clio.com/oauth/token"
-DEAUTHORIZE_URL = "https://app.clio.com/oauth/deauthorize"
+API_GATEWAY_KEY = "api_gateways"
+ACCESS_TOKEN_KEY = "access_tokens"
 
-HOST = "127.0.0.1"
-PORT = 8080
+# /callback, the token API, /metrics and the grid endpoint (see api.py for the headless entry point)
+app.include_router(api_router)
+app.on_startup(startup)
+app.on_shutdown(shutdown)
 
-REDIRECT_URI = "http://127.0.0.1:8080/callback"
+REGISTRY.register(Gauge("nicegui_clients", "Browser tabs with a page built on this server.", [],
+                        lambda: {(): len(Client.instances)}))
 
-API_GATEWAY_KEY = "api_gateways"
-ACCESS_TOKEN_KEY = "access_tokens"
+# Pushes committed gateway and token changes to every connected grid
+change_bus = ChangeBus()
+token_store.add_listener(change_bus.publish)
 
-def load_api_gateways():
-    """Load stored API gateway data or initialize default values with unique IDs."""
-    stored_data = app.storage.general.get(API_GATEWAY_KEY, {
-        "columns": ["ID", "Name", "Client Id", "Client Secret"],
-        "rows": []
-    })
-
-    # Convert column names to AG Grid column definitions
-    column_definitions = []
-    for col in stored_data["columns"]:
-        col_field = col.lower().replace(" ", "_")
-
-        # Custom properties for ID column
-        if col == "ID":
-            column_definitions.append({
-                "headerName": col,
-                "field": col_field,
-                "editable": False,
-                "checkboxSelection": True,
-                "width": 30,  # Fixed width for ID column
-                "resizable": True
-            })
-        else:
-            column_definitions.append({
-                "headerName": col,
-                "field": col_field,
-                "editable": True
-            })
+def migrate_legacy_storage():
+    """Move gateways and tokens from app.storage.general into the token store (runs once)."""
+    if token_store.import_legacy(app.storage.general.get(API_GATEWAY_KEY), app.storage.general.get(ACCESS_TOKEN_KEY)):
+        app.storage.general.pop(API_GATEWAY_KEY, None)
+        app.storage.general.pop(ACCESS_TOKEN_KEY, None)
+
+    # State tokens used to be persisted here and were never cleaned up
+    for key in [key for key in app.storage.general if key.startswith("oauth_state_")]:
+        del app.storage.general[key]
+
+app.on_startup(migrate_legacy_storage)
 
-    # Convert row lists to dictionaries (including ID)
-    columns = [col.lower().replace(" ", "_") for col in stored_data["columns"]]
-    rows = [dict(zip(columns, row)) for row in stored_data["rows"]]
-
-    return columns, column_definitions, rows
-
-@app.get("/callback")
-async def callback(request: Request):
-    """Handle OAuth callback, validate state, and request access token."""
-    query_params = request.query_params
-    code = query_params.get("code")
-    state = query_params.get("state")
-
-    if not code or not state:
-        return ui.notify("Invalid request: Missing code or state.", type="warning")
-
-    state_key = f"oauth_state_{state}"
-    state_data = app.storage.general.get(state_key)
-
-    if not state_data:
-        return ui.notify("Invalid or expired state.", type="warning")
-
-    timestamp = state_data.get("timestamp", 0)
-    
-    # State token set to expire after 60 seconds
-    # Removes state token before completing callback 
-    if time.time() - timestamp > 60:
-        del app.storage.general[state_key]
-        return ui.notify("State expired. Please try again.", type="warning")
-
-    client_id = state_data.get("client_id")
-    client_secret = state_data.get("client_secret")
-    api_gateway = state_data.get("api_gateway")  # Retrieve API Gateway name
-
-    if not client_id or not client_secret:
-        del app.storage.general[state_key]
-        return ui.notify("Stored client credentials missing. Please restart authentication.", type="warning")
-
-    del app.storage.general[state_key]  # Remove state after use
-
-    payload = {
-        "client_id": client_id,
-        "client_secret": client_secret,
-        "grant_type": "authorization_code",
-        "code": code,
-        "redirect_uri": REDIRECT_URI
-    }
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-    async with httpx.AsyncClient() as client:
-        response = await client.post(TOKEN_URL, data=payload, headers=headers)
-
-    if response.status_code == 200:
-        token_data = response.json()
-        access_token = token_data.get("access_token")
-
-        # Store access token in app storage
-        access_token_list = app.storage.general.get(ACCESS_TOKEN_KEY, [])
-        new_token_entry = {
-            "id": len(access_token_list) + 1,
-            "api_gateway": api_gateway,
-            "access_token": access_token
-        }
-        access_token_list.append(new_token_entry)
-        app.storage.general[ACCESS_TOKEN_KEY] = access_token_list
-        return "Success"
-
-    else:
-        return "Error"
+def load_api_gateways():
+    """Return the API gateway grid columns, built once and shared read-only by every session."""
+    return gateway_model.column_definitions
 
 # Built on the single page application example
 # https://github.com/zauberzeug/nicegui/blob/main/examples/single_page_app/main.py
@@ -126,25 +58,50 @@ async def callback(request: Request):
 @ui.page('/')  # normal index page (e.g. the entry point of the app)
 @ui.page('/{_:path}')  # all other pages will be handled by the router but must be registered to also show the SPA index page
 async def main():    
-    router = Router()
+    router = Router(keep_alive=PAGE_CACHE_SIZE)
+    # Gateway and token changes made from this browser are journaled under its address
+    operator = f"ui:{ui.context.client.ip or 'unknown'}"
+
+    def update_gateways(rows):
+        with acting_as(operator):
+            token_store.update_gateways(rows)
+
+    def subscribe_grid(grid, table, row_filter=None):
+        """Keep a grid live with store changes until its page is left or the client is deleted."""
+        def handle_change(action, rows):
+            if row_filter is not None:
+                rows = [row for row in rows if row_filter(action, row)]
+            if rows:
+                apply_changes(grid, action, rows, GRID_FIELDS[table])
+
+        unsubscribe = change_bus.subscribe(table, handle_change)
+        router.on_leave(unsubscribe)
+        # A dropped socket that reconnects keeps its page, so only a deleted client stops listening
+        ui.context.client.on_delete(unsubscribe)
 
     @router.add('/')
     async def api_gateways():
         
         """Render API Gateways table with actions."""
-        columns, column_definitions, rows = load_api_gateways()
-
-        gateway_table = ui.aggrid({
-            "columnDefs": column_definitions,
-            "rowData": rows,
-            "rowSelection": "single",
-            "stopEditingWhenCellsLoseFocus": True,
-        })
-
-        def update_storage():
-            """Persist rows to storage."""
-            app.storage.general[API_GATEWAY_KEY] = {"columns": columns, "rows": [list(row.values()) for row in rows]}
-            gateway_table.update()
+        column_definitions = load_api_gateways()
+
+        # Rows are paged, sorted and filtered on the server
+        gateway_table = ui.aggrid(infinite_grid_options(
+            "api_gateways",
+            column_definitions,
+            rowSelection="single",
+            stopEditingWhenCellsLoseFocus=True,
+        ))
+
+        # Cell edits are coalesced per row and written after a short quiet period or when the page is left
+        edit_buffer = RowWriteBuffer(update_gateways)
+        router.on_leave(edit_buffer.flush)
+        ui.context.client.on_disconnect(edit_buffer.flush)
+
+        # Rows edited in this browser are already up to date, so their updates are not echoed back
+        local_edits = {}
+        subscribe_grid(gateway_table, "api_gateways",
+                       lambda action, row: action != "updated" or local_edits.pop(row["id"], None) != row)
 
         def open_add_row_dialog():
             """Opens a dialog box to collect user input for a new row."""
@@ -153,34 +110,66 @@ async def main():
                 name_input = ui.input(label="Name").classes('w-full')
                 client_id_input = ui.input(label="Client ID").classes('w-full')
                 client_secret_input = ui.input(label="Client Secret").classes('w-full')
+                # A region code, or the base URL of another Clio host
+                region_input = ui.select(list(REGION_BASE_URLS), label="Region", value=DEFAULT_REGION,
+                                         new_value_mode="add-unique").classes('w-full')
 
                 with ui.row():
-                    ui.button("Add", on_click=lambda: add_row(name_input.value, client_id_input.value, client_secret_input.value, dialog))
+                    ui.button("Add", on_click=lambda: add_row(name_input.value, client_id_input.value, client_secret_input.value,
+                                                              region_input.value, dialog))
                     ui.button("Cancel", on_click=dialog.close)
 
                 dialog.open()
 
-        def add_row(name, client_id, client_secret, dialog):
+        def open_import_dialog():
+            """Opens a dialog to bulk import gateways from a JSONL or CSV file."""
+            async def handle_upload(e):
+                fmt = "csv" if e.file.name.lower().endswith(".csv") else "jsonl"
+                # The upload is spooled to disk in chunks, then read line by line and committed in batches
+                with tempfile.TemporaryFile() as spool:
+                    async for chunk in e.file.iterate():
+                        spool.write(chunk)
+                    spool.seek(0)
+                    with acting_as(operator):
+                        result = import_lines(token_store, "api_gateways", io.TextIOWrapper(spool, encoding="utf-8"), fmt)
+                dialog.close()
+                ui.notify(f"Imported {result['added']} API gateway(s): {result['duplicates']} duplicate(s), "
+                          f"{result['invalid']} invalid row(s) skipped.",
+                          type="warning" if result["invalid"] else "positive")
+
+            with ui.dialog() as dialog, ui.card():
+                ui.label("Import API Gateways (JSONL or CSV with name, client_id, client_secret and optional region)")
+                ui.upload(on_upload=handle_upload, auto_upload=True).props('accept=".jsonl,.json,.csv"')
+                ui.button("Cancel", on_click=dialog.close)
+
+            dialog.open()
+
+        def add_row(name, client_id, client_secret, region, dialog):
             """Adds a new row based on dialog input."""
             if not name or not client_id or not client_secret:
                 ui.notify("All fields are required!", type="warning")
                 return
+            if not is_valid_region(region):
+                ui.notify(f"Unknown region: {region}", type="warning")
+                return
 
-            new_id = max((row["id"] for row in rows), default=0) + 1  # Ensure unique ID
-            new_row = {"id": new_id, "name": name, "client_id": client_id, "client_secret": client_secret}
-            rows.append(new_row)
-            update_storage()
+            with acting_as(operator):
+                token_store.add_gateway(name, client_id, client_secret, region=region or None)  # Primary key assigned by the store
             dialog.close()
             ui.notify(f"Added new API Gateway: {name}")
 
         def handle_cell_value_change(e):
-            """Handles inline cell edits and updates storage."""
+            """Handles inline cell edits and buffers the changed row for storage."""
+            if "oldValue" in e.args and e.args["oldValue"] == e.args.get("newValue"):
+                return
+
             updated_row = e.args["data"]
-            for i, row in enumerate(rows):
-                if row["id"] == updated_row["id"]:
-                    rows[i] = updated_row 
-                    break
-            update_storage()
+            if not is_valid_region(updated_row.get("region")):
+                ui.notify(f"Unknown region: {updated_row['region']}", type="warning")
+                return
+            # The browser already shows the edit, so the grid is not sent back to the client
+            local_edits[updated_row["id"]] = updated_row
+            edit_buffer.mark_dirty(updated_row)
             ui.notify(f"Updated row: {updated_row}")
 
         async def delete_selected():
@@ -193,10 +182,9 @@ async def main():
 
             selected_id = selected_rows[0]["id"]
 
-            nonlocal rows 
-            rows[:] = [row for row in rows if row["id"] != selected_id]
-
-            update_storage()
+            edit_buffer.discard(selected_id)
+            with acting_as(operator):
+                token_store.delete_gateway(selected_id)
             ui.notify(f"Deleted row with ID: {selected_id}")
 
         async def create_access_token():
@@ -211,22 +199,23 @@ async def main():
             client_id = selected_row.get("client_id")
             client_secret = selected_row.get("client_secret")
             api_gateway= selected_row.get("name")
+            region = selected_row.get("region")
 
             if not client_id or not client_secret:
                 ui.notify("Client ID or Client Secret is missing!", type="warning")
                 return
+            if not is_valid_region(region):
+                ui.notify(f"Unknown region: {region}", type="warning")
+                return
 
-            # Generate a random state token
-            state = secrets.token_urlsafe(16)
-            timestamp = time.time()
-
-            # Store state, timestamp, client ID, and client secret in storage
-            app.storage.general[f"oauth_state_{state}"] = {
-                "timestamp": timestamp,
+            # Store client ID and client secret under a new random state token
+            state = oauth_states.create({
                 "client_id": client_id,
                 "client_secret": client_secret,
-                "api_gateway": api_gateway
-            }
+                "api_gateway": api_gateway,
+                "gateway_id": selected_row.get("id"),
+                "region": region,
+            })
 
             # Construct the OAuth URL
             params = {
@@ -235,7 +224,8 @@ async def main():
                 "redirect_uri": REDIRECT_URI,
                 "state": state
             }
-            auth_url = f"{AUTH_BASE_URL}?{urlencode(params)}"
+            # The callback exchanges the code at the same region's token endpoint
+            auth_url = f"{endpoints(region).auth_url}?{urlencode(params)}"
 
             # Open the URL in a new tab
             ui.navigate.to(auth_url, new_tab=True)
@@ -246,29 +236,37 @@ async def main():
         ui.button("Add API Gateway", on_click=open_add_row_dialog)
         ui.button("Delete Selected", on_click=delete_selected)
         ui.button("Create Access Token", on_click=create_access_token)
+        ui.button("Import", on_click=open_import_dialog).props('flat')
+        ui.button("Export CSV", on_click=lambda: ui.download("/api/export/api_gateways?format=csv")).props('flat')
 
     @router.add('/access_tokens')
     def access_tokens():
         """Render the Access Tokens table with a reload button and copy functionality."""
 
-        # Function to load stored access tokens
-        def load_access_tokens():
-            return app.storage.general.get(ACCESS_TOKEN_KEY, [])
-
         # AG Grid column definitions
         column_definitions = [
-            {"headerName": "ID", "field": "id", "checkboxSelection": True, "width": 30},
+            {"headerName": "ID", "field": "id", "checkboxSelection": True, "width": 30, "filter": "agNumberColumnFilter"},
             {"headerName": "API Gateway", "field": "api_gateway"},
             {"headerName": "Access Token", "field": "access_token"},
+            {"headerName": "Region", "field": "region"},
+            # Computed in the browser; sorting and filtering use the indexed expires_at column on the server
+            {"headerName": "Expires In (days)", "colId": "expires_in", "filter": "agNumberColumnFilter",
+             ":valueGetter": "(params) => params.data && params.data.expires_at != null"
+                             " ? Math.round((params.data.expires_at - Date.now() / 1000) / 8640) / 10 : null"},
+            # Filter on "invalid", "expired" or "no_gateway" to find dead tokens
+            {"headerName": "Status", "field": "status"},
+            {"headerName": "Last Checked", "field": "checked_at", "filter": "agNumberColumnFilter",
+             ":valueFormatter": "(params) => params.value ? new Date(params.value * 1000).toLocaleString() : ''"},
         ]
 
-        # Initialize AG Grid with stored tokens
-        token_table = ui.aggrid({
-            "columnDefs": column_definitions,
-            "rowData": load_access_tokens(),
-            "rowSelection": "single",
-            "stopEditingWhenCellsLoseFocus": True,
-        })
+        # Initialize AG Grid; stored tokens are paged, sorted and filtered on the server
+        token_table = ui.aggrid(infinite_grid_options(
+            "access_tokens",
+            column_definitions,
+            rowSelection="multiple",
+            stopEditingWhenCellsLoseFocus=True,
+        ))
+        subscribe_grid(token_table, "access_tokens")
 
         async def copy_selected_token():
             """Copies the selected access token to clipboard."""
@@ -283,49 +281,93 @@ async def main():
             ui.run_javascript(f'navigator.clipboard.writeText("{selected_token}")')
             ui.notify("Access token copied to clipboard!")
 
+        async def deauthorize_tokens(tokens):
+            """Deauthorize tokens concurrently, then remove the successful ones with a single storage write."""
+            progress.set_value(0)
+            progress.set_visibility(True)
+
+            # Each token is revoked at the region that issued it
+            deauthorized_ids = await oauth_client.deauthorize_many(
+                {token["id"]: (endpoints(token.get("region")).deauthorize_url, token["access_token"]) for token in tokens},
+                concurrency=int(concurrency_input.value or 1),
+                on_progress=lambda completed, total: progress.set_value(completed / total),
+            )
+            progress.set_visibility(False)
+
+            if deauthorized_ids:
+                # Remove every deauthorized token from storage in one transaction
+                with acting_as(operator):
+                    token_store.delete_tokens(deauthorized_ids)
+
+            failed = len(tokens) - len(deauthorized_ids)
+            if failed:
+                ui.notify(f"Deauthorized {len(deauthorized_ids)} token(s), {failed} failed.", type="warning")
+            else:
+                ui.notify(f"Deauthorized {len(deauthorized_ids)} token(s).")
+
         async def delete_selected_token():
-            """Deauthorize and delete the selected access token."""
+            """Deauthorize and delete the selected access tokens."""
             selected_rows = await token_table.get_selected_rows()
 
             if not selected_rows:
                 ui.notify("No access token selected for deletion!", type="warning")
                 return
 
-            selected_token = selected_rows[0]["access_token"]
-            selected_id = selected_rows[0]["id"]
+            await deauthorize_tokens(selected_rows)
 
-            # Deauthorize token before deletion
-            headers = {
-                "Authorization": f"Bearer {selected_token}",
-                "Content-Type": "application/x-www-form-urlencoded",
-            }
-            data = {"token": selected_token}
-
-            async with httpx.AsyncClient() as client:
-                response = await client.post(DEAUTHORIZE_URL, headers=headers, data=data)
-
-            if response.status_code == 200:
-                # Remove the token from storage after successful deauthorization
-                access_token_list = app.storage.general.get(ACCESS_TOKEN_KEY, [])
-                access_token_list = [token for token in access_token_list if token["id"] != selected_id]
-                app.storage.general[ACCESS_TOKEN_KEY] = access_token_list
+        async def delete_gateway_tokens():
+            """Deauthorize and delete every access token issued for the chosen API gateway."""
+            api_gateway = gateway_select.value
+            # tokens(api_gateway=None) means every token, which must never be revoked by accident
+            if not api_gateway:
+                ui.notify("Select an API gateway first!", type="warning")
+                return
+            tokens = token_store.tokens(api_gateway=api_gateway)
 
-                token_table.options["rowData"] = access_token_list
-                token_table.update()
+            if not tokens:
+                ui.notify("No access tokens stored for this API gateway!", type="warning")
+                return
 
-                ui.notify(f"Deauthorized: {selected_token}")
-            else:
-                ui.notify(f"Failed to deauthorize access token. Status: {response.status_code}", type="warning")
+            await deauthorize_tokens(tokens)
+
+        async def validate_tokens(force=False):
+            """Probe every stored token concurrently; results younger than the health TTL are reused unless forced."""
+            progress.set_value(0)
+            progress.set_visibility(True)
+            counts = await health_checker.validate_all(
+                concurrency=PROBE_CONCURRENCY,
+                force=force,
+                on_progress=lambda completed, total: progress.set_value(completed / total),
+            )
+            progress.set_visibility(False)
+
+            if not counts:
+                ui.notify("Every token was checked recently.")
+                return
+            summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+            dead = sum(count for status, count in counts.items() if status != "valid")
+            ui.notify(f"Checked {sum(counts.values())} token(s): {summary}.", type="warning" if dead else "positive")
 
         def reload_table():
-            """Refreshes the table data by loading stored access tokens."""
-            token_table.options["rowData"] = load_access_tokens()
-            token_table.update()
+            """Refreshes the loaded window of the table from the token store."""
+            token_table.run_grid_method("refreshInfiniteCache")
+            gateway_select.set_options(token_store.token_gateways())
             ui.notify("Access token table reloaded.")
 
-        ui.button("Reload Table", on_click=reload_table)
-        ui.button("Deauthorize Token", on_click=delete_selected_token)
-        ui.button("Copy Token", on_click=copy_selected_token)
+        progress = ui.linear_progress(value=0, show_value=False)
+        progress.set_visibility(False)
+
+        with ui.row().classes('items-center'):
+            ui.button("Reload Table", on_click=reload_table)
+            ui.button("Deauthorize Selected", on_click=delete_selected_token)
+            ui.button("Copy Token", on_click=copy_selected_token)
+            ui.button("Validate All", on_click=lambda: validate_tokens())
+            ui.button("Recheck All", on_click=lambda: validate_tokens(force=True)).props('flat')
+
+        with ui.row().classes('items-center'):
+            gateway_select = ui.select(token_store.token_gateways(), label="API Gateway").classes('w-64')
+            ui.button("Deauthorize All for Gateway", on_click=delete_gateway_tokens)
+            concurrency_input = ui.number(label="Concurrency", value=DEAUTHORIZE_CONCURRENCY, min=1, max=100, step=1).classes('w-32')
 
 
     with ui.header().classes('row justify-between items-center') as header:
@@ -351,5 +393,6 @@ async def main():
     # this places the content which should be displayed
     router.frame().classes('w-full p-4 bg-gray-100')
 
-ui.run(host=HOST, port=PORT, title="Clio Access Token Manager")
+if __name__ in {"__main__", "__mp_main__"}:
+    ui.run(host=HOST, port=PORT, title="Clio Access Token Manager")
 
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Local stand-in for Clio's OAuth endpoints, used by the benchmarks.
+
+Run on its own with:  python benchmarks/mock_clio.py --port 9000 --latency 0.05
+"""
+import argparse
+import asyncio
+import random
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from urllib.parse import urlencode
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
+
+
+@dataclass
+class MockConfig:
+    latency: float = 0.0  # seconds added to every response
+    error_rate: float = 0.0  # fraction of requests answered with 500
+    rate_limit_rate: float = 0.0  # fraction of requests answered with 429
+    retry_after: int = 1  # Retry-After header sent with 429 responses
+    expires_in: int = 30 * 24 * 60 * 60
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    mock = FastAPI()
+    mock.state.config = config
+    mock.state.counts = {}
+    mock.state.revoked = set()
+
+    async def simulate(endpoint: str):
+        """Apply latency and return an injected failure response, if any."""
+        mock.state.counts[endpoint] = mock.state.counts.get(endpoint, 0) + 1
+        if config.latency:
+            await asyncio.sleep(config.latency)
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            return JSONResponse({"error": "rate_limited"}, status_code=429,
+                                headers={"Retry-After": str(config.retry_after)})
+        if roll < config.rate_limit_rate + config.error_rate:
+            return JSONResponse({"error": "server_error"}, status_code=500)
+        return None
+
+    @mock.get("/oauth/authorize")
+    async def authorize(request: Request):
+        params = request.query_params
+        query = urlencode({"code": secrets.token_urlsafe(8), "state": params.get("state", "")})
+        return RedirectResponse(f"{params.get('redirect_uri')}?{query}")
+
+    @mock.post("/oauth/token")
+    async def token(request: Request):
+        failure = await simulate("token")
+        if failure:
+            return failure
+        form = await request.form()
+        if form.get("grant_type") not in ("authorization_code", "refresh_token"):
+            return JSONResponse({"error": "unsupported_grant_type"}, status_code=400)
+        body = {
+            "token_type": "bearer",
+            "access_token": secrets.token_urlsafe(24),
+            "expires_in": config.expires_in,
+        }
+        if form.get("grant_type") == "authorization_code":
+            body["refresh_token"] = secrets.token_urlsafe(24)
+        return body
+
+    @mock.post("/oauth/deauthorize")
+    async def deauthorize(request: Request):
+        failure = await simulate("deauthorize")
+        if failure:
+            return failure
+        mock.state.revoked.add((await request.form()).get("token"))
+        return PlainTextResponse("")
+
+    @mock.get("/api/v4/users/who_am_i")
+    async def who_am_i(request: Request):
+        failure = await simulate("who_am_i")
+        if failure:
+            return failure
+        # Every token is accepted unless it was deauthorized here
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not token or token in mock.state.revoked:
+            return JSONResponse({"error": {"type": "AuthenticationError"}}, status_code=401)
+        return {"data": {"id": 1, "name": "Mock User"}}
+
+    return mock
+
+
+class MockClioServer:
+    """Runs the mock app with uvicorn in a background thread."""
+
+    def __init__(self, config: MockConfig, host: str = "127.0.0.1", port: int = 9000) -> None:
+        self.app = create_app(config)
+        self.base_url = f"http://{host}:{port}"
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host=host, port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def urls(self) -> dict:
+        """Environment overrides that point app.py at this server."""
+        return {
+            "AUTH_BASE_URL": f"{self.base_url}/oauth/authorize",
+            "TOKEN_URL": f"{self.base_url}/oauth/token",
+            "DEAUTHORIZE_URL": f"{self.base_url}/oauth/deauthorize",
+            "PROBE_URL": f"{self.base_url}/api/v4/users/who_am_i",
+        }
+
+    def __enter__(self) -> "MockClioServer":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.server.should_exit = True
+        self.thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+    config = MockConfig(args.latency, args.error_rate, args.rate_limit_rate, args.retry_after)
+    uvicorn.run(create_app(config), host=args.host, port=args.port)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""Measure token exchange, deauthorization and storage costs as the token store grows.
+
+Starts the mock Clio server, then for every store size seeds a fresh database,
+launches app.py against the mock and drives /callback over HTTP. Deauthorization
+and storage writes are measured in-process against the same modules app.py uses.
+
+    python benchmarks/run_benchmarks.py --sizes 10 100 1000 10000 --output bench_results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx
+
+from clio_oauth import ClioOAuthClient
+from mock_clio import MockClioServer, MockConfig
+from token_store import TokenStore
+from token_health import TokenHealthChecker
+from upstream_policy import UpstreamPolicy
+
+
+def percentile(samples: List[float], p: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def summarize(latencies: List[float], elapsed: float, succeeded: int) -> Dict[str, Any]:
+    """Throughput and latency percentiles (milliseconds) for one batch of operations."""
+    return {
+        "count": len(latencies),
+        "succeeded": succeeded,
+        "throughput_per_s": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+    }
+
+
+def bytes_written() -> Optional[int]:
+    """Bytes this process has passed to write() so far (Linux only)."""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def database_bytes(path: str) -> int:
+    return sum(os.path.getsize(path + suffix) for suffix in ("", "-wal") if os.path.exists(path + suffix))
+
+
+def seed_store(path: str, size: int) -> TokenStore:
+    """Create a store holding one gateway and `size` tokens."""
+    store = TokenStore(path)
+    gateway = store.add_gateway("bench", "bench-client", "bench-secret")
+    now = time.time()
+    with store.lock, store.connection:
+        store.connection.executemany(
+            "INSERT INTO access_tokens (gateway_id, api_gateway, access_token, created_at) VALUES (?, ?, ?, ?)",
+            [(gateway["id"], f"bench-{i % 50}", f"seed-token-{i}", now) for i in range(size)])
+    return store
+
+
+def bench_storage(directory: str, size: int, operations: int) -> Dict[str, Any]:
+    """Latency and bytes written per single-token insert and delete at a given store size."""
+    path = os.path.join(directory, "storage-bench.db")
+    store = seed_store(path, size)
+
+    latencies, ids = [], []
+    before, start = bytes_written(), time.perf_counter()
+    for i in range(operations):
+        t = time.perf_counter()
+        ids.append(store.add_token("bench", f"new-token-{i}", 1)["id"])
+        latencies.append(time.perf_counter() - t)
+    insert = summarize(latencies, time.perf_counter() - start, operations)
+    after = bytes_written()
+    insert["bytes_written_per_op"] = (after - before) // operations if before is not None else None
+
+    latencies = []
+    before, start = bytes_written(), time.perf_counter()
+    for token_id in ids:
+        t = time.perf_counter()
+        store.delete_tokens([token_id])
+        latencies.append(time.perf_counter() - t)
+    delete = summarize(latencies, time.perf_counter() - start, operations)
+    after = bytes_written()
+    delete["bytes_written_per_op"] = (after - before) // operations if before is not None else None
+
+    database_size = database_bytes(path)
+    store.close()
+    return {"insert": insert, "delete": delete, "database_bytes": database_size}
+
+
+async def bench_deauthorize(deauthorize_url: str, count: int, concurrency: int, rate_limit: float) -> Dict[str, Any]:
+    """Concurrent deauthorizations through the shared pooled client."""
+    client = ClioOAuthClient(policy=UpstreamPolicy(rate=rate_limit, burst=int(rate_limit)))
+    await client.start()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    succeeded = 0
+
+    async def revoke(i: int) -> None:
+        nonlocal succeeded
+        async with semaphore:
+            t = time.perf_counter()
+            if await client.deauthorize(deauthorize_url, f"token-{i}"):
+                succeeded += 1
+            latencies.append(time.perf_counter() - t)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(revoke(i) for i in range(count)))
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return summarize(latencies, elapsed, succeeded)
+
+
+async def bench_validate(directory: str, size: int, probe_url: str) -> Dict[str, Any]:
+    """One "validate all" run over a store of `size` tokens, probing every token."""
+    store = seed_store(os.path.join(directory, "validate-bench.db"), size)
+    client = ClioOAuthClient()
+    await client.start()
+    start = time.perf_counter()
+    counts = await TokenHealthChecker(store, client, probe_url).validate_all(force=True)
+    elapsed = time.perf_counter() - start
+    await client.close()
+    store.close()
+    return {"tokens": size, "elapsed_s": round(elapsed, 3),
+            "tokens_per_s": round(size / elapsed, 2) if elapsed else None, "statuses": counts}
+
+
+async def bench_callbacks(base_url: str, states: List[str], concurrency: int) -> Dict[str, Any]:
+    """Drive /callback token exchanges against a running app.py."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    succeeded = 0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        async def exchange(state: str) -> None:
+            nonlocal succeeded
+            async with semaphore:
+                t = time.perf_counter()
+                response = await client.get("/callback", params={"code": "bench-code", "state": state})
+                latencies.append(time.perf_counter() - t)
+                if response.status_code == 200 and "Success" in response.text:
+                    succeeded += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(exchange(state) for state in states))
+        elapsed = time.perf_counter() - start
+    return summarize(latencies, elapsed, succeeded)
+
+
+def start_app(directory: str, env: Dict[str, str]) -> subprocess.Popen:
+    log = open(os.path.join(directory, "app.log"), "w")
+    return subprocess.Popen([sys.executable, os.path.join(ROOT, "app.py")], cwd=directory,
+                            env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT,
+                            start_new_session=True)
+
+
+def stop_app(process: subprocess.Popen) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=15)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def wait_until_ready(url: str, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"App did not start within {timeout} seconds")
+
+
+def run_size(mock: MockClioServer, size: int, args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, ".nicegui", "clio_tokens.db")
+        seed_store(database, size).close()
+
+        # Pending states are handed to the app through its restart-persistence file
+        state_file = os.path.join(directory, "oauth_states.json")
+        states = [f"bench-state-{i}" for i in range(args.callbacks)]
+        with open(state_file, "w") as f:
+            data = {"client_id": "bench-client", "client_secret": "bench-secret", "api_gateway": "bench", "gateway_id": 1}
+            json.dump({state: [time.time() + 3600, data] for state in states}, f)
+
+        process = start_app(directory, {**mock.urls, "PORT": str(args.app_port), "OAUTH_STATE_FILE": state_file,
+                                        "CLIO_RATE_LIMIT": str(args.clio_rate_limit)})
+        try:
+            base_url = f"http://127.0.0.1:{args.app_port}"
+            wait_until_ready(f"{base_url}/api/tokens/bench")
+            database_before = database_bytes(database)
+            callbacks = asyncio.run(bench_callbacks(base_url, states, args.concurrency))
+            callbacks["database_bytes_per_op"] = (database_bytes(database) - database_before) // max(1, args.callbacks)
+        finally:
+            stop_app(process)
+
+        return {
+            "stored_tokens": size,
+            "callback": callbacks,
+            "deauthorize": asyncio.run(bench_deauthorize(mock.urls["DEAUTHORIZE_URL"], args.deauthorizations, args.concurrency,
+                                                         args.clio_rate_limit)),
+            "storage": bench_storage(directory, size, args.storage_ops),
+            "validate": asyncio.run(bench_validate(directory, size, mock.urls["PROBE_URL"])),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--callbacks", type=int, default=200, help="token exchanges per size")
+    parser.add_argument("--deauthorizations", type=int, default=200, help="deauthorizations per size")
+    parser.add_argument("--storage-ops", type=int, default=200, help="inserts and deletes per size")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02, help="mock Clio latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    # The app's per-host limiter would otherwise cap every run at its 20 requests/s default
+    parser.add_argument("--clio-rate-limit", type=float, default=10000.0,
+                        help="CLIO_RATE_LIMIT given to the app, in requests per second")
+    parser.add_argument("--mock-port", type=int, default=9000)
+    parser.add_argument("--app-port", type=int, default=8081)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    config = MockConfig(latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+    results = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "runs": [],
+    }
+    print(f"Clio rate limit: {args.clio_rate_limit} requests/s per host")
+    with MockClioServer(config, port=args.mock_port) as mock:
+        for size in args.sizes:
+            run = run_size(mock, size, args)
+            results["runs"].append(run)
+            print(f"{size:>6} tokens | callback p50 {run['callback']['p50_ms']} ms p99 {run['callback']['p99_ms']} ms "
+                  f"| deauthorize p50 {run['deauthorize']['p50_ms']} ms "
+                  f"| insert {run['storage']['insert']['bytes_written_per_op']} B/op "
+                  f"| validate all {run['validate']['elapsed_s']} s")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
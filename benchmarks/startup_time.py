@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Measure how long the headless API (api.py) and the full UI (app.py) take to serve their first request.
+
+Each run starts the process in a fresh directory and polls /metrics until it answers.
+Exits with status 1 if the headless median exceeds the target:
+
+    python benchmarks/startup_time.py --runs 5 --target 2.0
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds from process start until the headless API answers its first request
+HEADLESS_STARTUP_TARGET = 2.0
+
+
+def time_to_first_response(script: str, port: int, timeout: float = 60) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join(ROOT, script)], cwd=directory,
+                                   env={**os.environ, "PORT": str(port)},
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while time.perf_counter() - start < timeout:
+                try:
+                    if httpx.get(f"http://127.0.0.1:{port}/metrics", timeout=1).status_code == 200:
+                        return time.perf_counter() - start
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.01)
+            raise RuntimeError(f"{script} did not start within {timeout} seconds")
+        finally:
+            process.terminate()
+            process.wait(timeout=15)
+
+
+def measure(script: str, port: int, runs: int) -> Dict[str, float]:
+    samples: List[float] = [time_to_first_response(script, port) for _ in range(runs)]
+    return {"median_s": round(statistics.median(samples), 3), "min_s": round(min(samples), 3),
+            "max_s": round(max(samples), 3)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--target", type=float, default=HEADLESS_STARTUP_TARGET,
+                        help="maximum median startup time of api.py in seconds")
+    parser.add_argument("--skip-ui", action="store_true", help="only measure the headless API")
+    args = parser.parse_args()
+
+    results = {"api.py": measure("api.py", args.port, args.runs)}
+    if not args.skip_ui:
+        results["app.py"] = measure("app.py", args.port, args.runs)
+    for script, result in results.items():
+        print(f"{script:>7} | median {result['median_s']} s | min {result['min_s']} s | max {result['max_s']} s")
+
+    if results["api.py"]["median_s"] > args.target:
+        print(f"Headless startup exceeds the {args.target} s target")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
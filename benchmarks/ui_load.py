@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""Load-test the NiceGUI pages with simulated browser tabs.
+
+Each simulated tab loads a page over HTTP and connects the NiceGUI websocket
+the way the browser's JavaScript does. It then switches between the API
+Gateways and Access Tokens pages, fetches the first grid block of each page,
+and reloads every few rounds. The client side reports page load and route
+switch latency. The server's /metrics reports page build time, event loop lag
+and memory per connected tab:
+
+    python benchmarks/ui_load.py --clients 10 50 100 --rounds 20 --tokens 5000
+"""
+import argparse
+import ast
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx
+import socketio
+
+from grid_model import GRID_BLOCK_SIZE, GRID_ENDPOINT
+from run_benchmarks import seed_store, start_app, stop_app, summarize, wait_until_ready
+
+# Router paths of app.py and the grid table each one shows
+PAGES = {"/": "api_gateways", "/access_tokens": "access_tokens"}
+
+SOCKET_PATH = "/_nicegui_ws/socket.io"
+# How long a client waits for the server's first update after asking for a page
+UPDATE_TIMEOUT = 30.0
+
+# Histograms read from /metrics before and after each run
+PAGE_BUILD_METRIC = "nicegui_page_build_duration_seconds"
+EVENT_LOOP_LAG_METRIC = "event_loop_lag_seconds"
+
+
+class SimulatedTab:
+    """One browser tab: loads a page, speaks the NiceGUI socket protocol and opens routes through the page frame."""
+
+    def __init__(self, base_url: str, http: httpx.AsyncClient) -> None:
+        self.base_url = base_url
+        self.http = http
+        self.sio: Optional[socketio.AsyncClient] = None
+        self.client_id = ""
+        self.frame: Tuple[int, str] = (0, "")  # element id and listener id of the router frame's "open" event
+        self.next_message_id = 0
+        self.updated = asyncio.Event()
+
+    async def _on_message(self, event: str, data: Any = None) -> None:
+        if isinstance(data, dict) and "_id" in data:
+            self.next_message_id = max(self.next_message_id, data["_id"] + 1)
+        if event == "update":
+            self.updated.set()
+
+    async def load(self, path: str) -> float:
+        """Load `path` like a browser (HTML, websocket, first route build) and return the seconds it took."""
+        start = time.perf_counter()
+        await self.close()
+        response = await self.http.get(self.base_url + path)
+        response.raise_for_status()
+        query = ast.literal_eval(re.search(r"query: (\{[^}]*\})", response.text).group(1))
+        raw = re.search(r"parseElements\(String\.raw`(.*?)`\)", response.text, re.S).group(1)
+        for entity, char in (("&#36;", "$"), ("&#96;", "`"), ("&gt;", ">"), ("&lt;", "<"), ("&amp;", "&")):
+            raw = raw.replace(entity, char)
+        elements = json.loads(raw)
+        self.frame = next((int(element_id), event["listener_id"]) for element_id, element in elements.items()
+                          for event in element.get("events", []) if event["type"] == "open")
+
+        self.client_id = query["client_id"]
+        self.next_message_id = query.get("next_message_id", 0)
+        query.update(document_id=str(uuid.uuid4()), tab_id=str(uuid.uuid4()))
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.sio.on("*", self._on_message)
+        params = {key: str(value).lower() if isinstance(value, bool) else value for key, value in query.items()}
+        await self.sio.connect(f"{self.base_url}?{urlencode(params)}", socketio_path=SOCKET_PATH,
+                               transports=["websocket"])
+        if not query.get("implicit_handshake"):
+            if not await self.sio.call("handshake", query, timeout=UPDATE_TIMEOUT):
+                raise RuntimeError(f"Handshake rejected for client {self.client_id}")
+        await self.open(path)
+        return time.perf_counter() - start
+
+    async def open(self, path: str) -> float:
+        """Switch the router frame to `path`, wait for the server's update and fetch the grid's first block."""
+        start = time.perf_counter()
+        self.updated.clear()
+        element_id, listener_id = self.frame
+        await self.sio.emit("event", {"id": element_id, "client_id": self.client_id, "listener_id": listener_id,
+                                      "args": [json.dumps(path)]})
+        await asyncio.wait_for(self.updated.wait(), UPDATE_TIMEOUT)
+        await self.sio.emit("ack", {"client_id": self.client_id, "next_message_id": self.next_message_id})
+        response = await self.http.post(self.base_url + GRID_ENDPOINT.format(table=PAGES[path]),
+                                        json={"startRow": 0, "endRow": GRID_BLOCK_SIZE})
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    async def close(self) -> None:
+        if self.sio is not None:
+            await self.sio.disconnect()
+            self.sio = None
+
+
+def read_histograms(base_url: str) -> Dict[str, Dict[str, Any]]:
+    """Bucket counts, sum and count of every histogram in /metrics, summed over labels."""
+    histograms: Dict[str, Dict[str, Any]] = {}
+    gauges: Dict[str, float] = {}
+    for line in httpx.get(f"{base_url}/metrics", timeout=10).text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name_labels, value = line.rsplit(" ", 1)
+        name = name_labels.split("{", 1)[0]
+        for suffix in ("_bucket", "_sum", "_count"):
+            if name.endswith(suffix):
+                histogram = histograms.setdefault(name[:-len(suffix)], {"buckets": {}, "sum": 0.0, "count": 0})
+                if suffix == "_bucket":
+                    bound = float(re.search(r'le="([^"]+)"', name_labels).group(1))
+                    histogram["buckets"][bound] = histogram["buckets"].get(bound, 0) + float(value)
+                else:
+                    histogram[suffix[1:]] += float(value)
+                break
+        else:
+            gauges[name] = gauges.get(name, 0.0) + float(value)
+    return {"histograms": histograms, "gauges": gauges}
+
+
+def histogram_delta(before: Dict[str, Any], after: Dict[str, Any], name: str) -> Dict[str, Any]:
+    """Count, mean and bucket-bound p50/p99 (milliseconds) of the observations made between two scrapes."""
+    old = before["histograms"].get(name, {"buckets": {}, "sum": 0.0, "count": 0})
+    new = after["histograms"].get(name, {"buckets": {}, "sum": 0.0, "count": 0})
+    count = new["count"] - old["count"]
+    if not count:
+        return {"count": 0}
+    buckets = sorted((bound, cumulative - old["buckets"].get(bound, 0)) for bound, cumulative in new["buckets"].items())
+
+    def upper_bound(p: float) -> float:
+        return next(bound for bound, cumulative in buckets if cumulative >= p / 100 * count)
+
+    return {
+        "count": int(count),
+        "mean_ms": round((new["sum"] - old["sum"]) / count * 1000, 3),
+        "p50_le_ms": upper_bound(50) * 1000,
+        "p99_le_ms": upper_bound(99) * 1000,
+    }
+
+
+async def drive(base_url: str, clients: int, rounds: int, reload_every: int,
+                on_connected) -> Dict[str, List[float]]:
+    """Run `clients` tabs through `rounds` route switches each; calls on_connected() once every tab is loaded."""
+    timings: Dict[str, List[float]] = {"load": [], "switch": [], "reload": []}
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(timeout=UPDATE_TIMEOUT, limits=limits) as http:
+        tabs = [SimulatedTab(base_url, http) for _ in range(clients)]
+        paths = list(PAGES)
+        timings["load"] = await asyncio.gather(*(tab.load(paths[i % 2]) for i, tab in enumerate(tabs)))
+        on_connected()
+
+        async def run(i: int, tab: SimulatedTab) -> None:
+            for round_number in range(1, rounds + 1):
+                path = paths[(i + round_number) % 2]
+                if reload_every and round_number % reload_every == 0:
+                    timings["reload"].append(await tab.load(path))
+                else:
+                    timings["switch"].append(await tab.open(path))
+
+        try:
+            await asyncio.gather(*(run(i, tab) for i, tab in enumerate(tabs)))
+        finally:
+            await asyncio.gather(*(tab.close() for tab in tabs), return_exceptions=True)
+    return timings
+
+
+def run_load(clients: int, args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        seed_store(os.path.join(directory, ".nicegui", "clio_tokens.db"), args.tokens).close()
+        process = start_app(directory, {"PORT": str(args.app_port)})
+        base_url = f"http://127.0.0.1:{args.app_port}"
+        try:
+            wait_until_ready(f"{base_url}/metrics")
+            idle = read_histograms(base_url)
+            loaded: Dict[str, Any] = {}
+
+            start = time.perf_counter()
+            timings = asyncio.run(drive(base_url, clients, args.rounds, args.reload_every,
+                                        lambda: loaded.update(read_histograms(base_url))))
+            elapsed = time.perf_counter() - start
+            done = read_histograms(base_url)
+        finally:
+            stop_app(process)
+
+    idle_memory = idle["gauges"].get("process_resident_memory_bytes", 0)
+    loaded_memory = loaded["gauges"].get("process_resident_memory_bytes", 0)
+    return {
+        "clients": clients,
+        "connected_tabs": int(loaded["gauges"].get("nicegui_clients", 0)),
+        "page_load": summarize(timings["load"], elapsed, len(timings["load"])),
+        "route_switch": summarize(timings["switch"], elapsed, len(timings["switch"])),
+        "reload": summarize(timings["reload"], elapsed, len(timings["reload"])),
+        "page_build": histogram_delta(idle, done, PAGE_BUILD_METRIC),
+        "event_loop_lag": histogram_delta(idle, done, EVENT_LOOP_LAG_METRIC),
+        "memory_idle_mb": round(idle_memory / 2**20, 1),
+        "memory_per_client_kb": round((loaded_memory - idle_memory) / clients / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 50, 100], help="simulated tabs per run")
+    parser.add_argument("--rounds", type=int, default=20, help="route switches per tab")
+    parser.add_argument("--reload-every", type=int, default=5, help="reload instead of switching every N rounds")
+    parser.add_argument("--tokens", type=int, default=1000, help="tokens seeded into the store")
+    parser.add_argument("--app-port", type=int, default=8083)
+    parser.add_argument("--output", default="ui_load_results.json")
+    args = parser.parse_args()
+
+    results = {"timestamp": time.time(), "config": vars(args), "runs": []}
+    for clients in args.clients:
+        run = run_load(clients, args)
+        results["runs"].append(run)
+        print(f"{clients:>4} tabs | load p99 {run['page_load']['p99_ms']} ms "
+              f"| switch p50 {run['route_switch']['p50_ms']} ms p99 {run['route_switch']['p99_ms']} ms "
+              f"| build p99 <= {run['page_build'].get('p99_le_ms')} ms "
+              f"| loop lag p99 <= {run['event_loop_lag'].get('p99_le_ms')} ms "
+              f"| {run['memory_per_client_kb']} KB/tab")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
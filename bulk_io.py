@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""Stream API gateways and access tokens in and out of the token store as JSONL or CSV.
+
+    python bulk_io.py export api_gateways --format csv > gateways.csv
+    python bulk_io.py import api_gateways gateways.csv
+
+Imports validate every row, skip rows whose client_id (gateways) or access
+token (tokens) is already stored or repeated in the input, and commit in
+batches, so neither direction holds the whole dataset in memory.
+"""
+import argparse
+import codecs
+import csv
+import io
+import json
+import sys
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from clio_regions import base_url
+from journal import Journal, JournalLockedError, acting_as
+from token_store import BULK_BATCH_SIZE
+
+FORMATS = ("jsonl", "csv")
+
+# Exported columns and the fields accepted on import, per table
+EXPORT_FIELDS = {
+    "api_gateways": ("id", "name", "client_id", "client_secret", "region"),
+    "access_tokens": ("id", "gateway_id", "api_gateway", "access_token", "created_at", "refresh_token", "expires_at",
+                      "region"),
+}
+REQUIRED_FIELDS = {
+    "api_gateways": ("name", "client_id", "client_secret"),
+    "access_tokens": ("api_gateway", "access_token"),
+}
+def _region(value: Any) -> str:
+    """A Clio region code or base URL; raises ValueError otherwise."""
+    base_url(str(value))
+    return str(value).strip()
+
+
+OPTIONAL_FIELDS = {
+    "api_gateways": {"region": _region},
+    "access_tokens": {"gateway_id": int, "created_at": float, "refresh_token": str, "expires_at": float,
+                      "region": _region},
+}
+# Column used to detect rows that are already stored
+DEDUPE_FIELDS = {"api_gateways": "client_id", "access_tokens": "access_token"}
+
+# Invalid rows reported back in detail; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+def export_lines(store: Any, table: str, fmt: str = "jsonl") -> Iterator[str]:
+    """Yield a table as JSONL or CSV lines, reading the store one batch at a time."""
+    fields = EXPORT_FIELDS[table]
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for row in store.iter_rows(table):
+            writer.writerow(["" if row[field] is None else row[field] for field in fields])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        for row in store.iter_rows(table):
+            yield json.dumps({field: row[field] for field in fields}) + "\n"
+
+
+class BulkImporter:
+    """Parses, validates, dedupes and batches imported rows; call add_line() per input line, then finish().
+
+    CSV input starts with a header row and holds one record per line.
+    """
+
+    def __init__(self, store: Any, table: str, fmt: str = "jsonl", batch_size: int = BULK_BATCH_SIZE) -> None:
+        if table not in REQUIRED_FIELDS:
+            raise ValueError(f"Unknown table: {table}")
+        self.store = store
+        self.table = table
+        self.fmt = fmt
+        self.header: Optional[List[str]] = None
+        self.batch_size = batch_size
+        self.dedupe_field = DEDUPE_FIELDS[table]
+        self.insert: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]] = (
+            store.add_gateways if table == "api_gateways" else store.add_tokens)
+        self.batch: List[Dict[str, Any]] = []
+        # Only the dedupe keys of this import are remembered, not the rows
+        self.seen: Set[str] = set()
+        self.row_number = 0
+        self.added = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def _error(self, message: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": self.row_number, "error": message})
+
+    def _validate(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        clean = {}
+        for field in REQUIRED_FIELDS[self.table]:
+            value = row.get(field)
+            if value is None or not str(value).strip():
+                self._error(f"Missing {field}")
+                return None
+            clean[field] = str(value).strip()
+        for field, field_type in OPTIONAL_FIELDS[self.table].items():
+            value = row.get(field)
+            if value is None or value == "":
+                clean[field] = None
+                continue
+            try:
+                clean[field] = field_type(value)
+            except (TypeError, ValueError):
+                self._error(f"Invalid {field}: {value!r}")
+                return None
+        return clean
+
+    def add_line(self, line: str) -> None:
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            return
+        if self.fmt == "csv":
+            values = next(csv.reader([line]))
+            if self.header is None:
+                self.header = [value.strip() for value in values]
+            else:
+                self.add(dict(zip(self.header, values)))
+            return
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            self.row_number += 1
+            self._error("Invalid JSON")
+            return
+        self.add(row)
+
+    def add(self, row: Any) -> None:
+        self.row_number += 1
+        if not isinstance(row, dict):
+            self._error("Expected an object")
+            return
+        clean = self._validate(row)
+        if clean is None:
+            return
+        key = clean[self.dedupe_field]
+        if key in self.seen:
+            self.duplicates += 1
+            return
+        self.seen.add(key)
+        self.batch.append(clean)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Drop rows that are already stored, then insert the rest in one transaction."""
+        if not self.batch:
+            return
+        existing = self.store.existing_values(self.table, self.dedupe_field, [row[self.dedupe_field] for row in self.batch])
+        new_rows = [row for row in self.batch if row[self.dedupe_field] not in existing]
+        self.duplicates += len(self.batch) - len(new_rows)
+        self.added += len(self.insert(new_rows)) if new_rows else 0
+        self.batch = []
+
+    def finish(self) -> Dict[str, Any]:
+        self.flush()
+        return {"added": self.added, "duplicates": self.duplicates, "invalid": self.invalid, "errors": self.errors}
+
+
+def import_lines(store: Any, table: str, lines: Iterable[str], fmt: str = "jsonl",
+                 batch_size: int = BULK_BATCH_SIZE) -> Dict[str, Any]:
+    """Import rows from an iterable of lines and return the counts of added, duplicate and invalid rows."""
+    importer = BulkImporter(store, table, fmt, batch_size)
+    for line in lines:
+        importer.add_line(line)
+    return importer.finish()
+
+
+async def aiter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a streamed request body into text lines without reading it whole."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def import_stream(store: Any, table: str, chunks: AsyncIterator[bytes], fmt: str = "jsonl") -> Dict[str, Any]:
+    """Import rows from a streamed request body, parsing and committing as lines arrive."""
+    importer = BulkImporter(store, table, fmt)
+    async for line in aiter_lines(chunks):
+        importer.add_line(line)
+    return importer.finish()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("table", choices=tuple(EXPORT_FIELDS))
+    parser.add_argument("path", nargs="?", default="-", help="file to read or write (default: stdin/stdout)")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension, else jsonl")
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    parser.add_argument("--no-journal", action="store_true", help="import without recording audit journal events")
+    args = parser.parse_args()
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "jsonl")
+
+    # Opens the store configured by STORAGE_BACKEND / REDIS_URL, like the app
+    from api import token_store, JOURNAL_DIRECTORY
+
+    if args.command == "export":
+        output = sys.stdout if args.path == "-" else open(args.path, "w", newline="")
+        with output:
+            output.writelines(export_lines(token_store, args.table, fmt))
+        return
+
+    journal = None
+    if not args.no_journal:
+        # Imports are journaled where the server reads them, which a running server keeps locked
+        try:
+            journal = Journal(token_store, JOURNAL_DIRECTORY)
+        except JournalLockedError:
+            parser.error(f"the server is writing the journal in {JOURNAL_DIRECTORY}; POST the file to "
+                         f"/api/import/{args.table} instead, or pass --no-journal to import without an audit trail")
+    source = sys.stdin if args.path == "-" else open(args.path, newline="")
+    with source, acting_as("bulk_import"):
+        result = import_lines(token_store, args.table, source, fmt, args.batch_size)
+    if journal is not None:
+        # No event loop runs the journal writer here
+        journal.flush()
+    token_store.close()
+    print(json.dumps(result, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import logging
+from collections import defaultdict
+from typing import Any, Callable, Dict, List
+
+log = logging.getLogger(__name__)
+
+# Handlers are called as handler(action, rows) with action "added", "updated" or "removed"
+ChangeHandler = Callable[[str, List[Dict[str, Any]]], None]
+
+
+class ChangeBus:
+    """Fans committed store changes out to every subscriber of a table."""
+
+    def __init__(self) -> None:
+        self.subscribers: Dict[str, List[ChangeHandler]] = defaultdict(list)
+
+    def subscribe(self, table: str, handler: ChangeHandler) -> Callable[[], None]:
+        """Subscribe to one table's changes and return a function that unsubscribes."""
+        self.subscribers[table].append(handler)
+
+        def unsubscribe() -> None:
+            if handler in self.subscribers[table]:
+                self.subscribers[table].remove(handler)
+        return unsubscribe
+
+    def publish(self, table: str, action: str, rows: List[Dict[str, Any]]) -> None:
+        """Deliver a change to every subscriber (signature matches TokenStore listeners)."""
+        for handler in list(self.subscribers[table]):
+            try:
+                handler(action, rows)
+            except Exception:
+                # One broken client connection must not stop delivery to the others
+                log.exception("Change handler for %s failed", table)
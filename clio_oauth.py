@@ -0,0 +1,175 @@
+import asyncio
+import importlib.util
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from clio_regions import origin
+from metrics import UPSTREAM_LATENCY
+from upstream_policy import UpstreamPolicy
+
+# Timeouts (seconds) for every call to the Clio OAuth endpoints
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 15.0
+POOL_TIMEOUT = 10.0
+
+# Connection pool per Clio origin (region), shared by all token exchanges and deauthorizations
+MAX_CONNECTIONS = 50
+MAX_KEEPALIVE_CONNECTIONS = 20
+KEEPALIVE_EXPIRY = 60.0
+
+# Default number of deauthorizations in flight during a bulk revoke
+DEAUTHORIZE_CONCURRENCY = 10
+
+# Health probes hit the API with each token's own rate limit, so they get a separate, faster policy
+PROBE_CONCURRENCY = 50
+PROBE_RATE_LIMIT = 200.0
+PROBE_ATTEMPTS = 2
+
+FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+
+class ClioOAuthClient:
+    """App-wide pooled HTTP client used for every Clio OAuth request, with one keep-alive pool per region."""
+
+    def __init__(self, http2: Optional[bool] = None, policy: Optional[UpstreamPolicy] = None) -> None:
+        # HTTP/2 is only available when the optional h2 package is installed
+        if http2 is None:
+            http2 = importlib.util.find_spec("h2") is not None
+        self.http2 = http2
+        # Retries, per-host rate limiting and circuit breaking for every call
+        self.policy = policy or UpstreamPolicy()
+        self.probe_policy = UpstreamPolicy(max_attempts=PROBE_ATTEMPTS, rate=PROBE_RATE_LIMIT, burst=int(PROBE_RATE_LIMIT))
+        self.clients: Dict[str, httpx.AsyncClient] = {}  # origin -> pool
+        self.started = False
+        self._warmup: Optional[asyncio.Task] = None
+
+    async def start(self, warm_urls: Iterable[str] = ()) -> None:
+        """Allow requests (called from app.on_startup) and connect the pools of warm_urls in the background.
+
+        Pools of other origins are opened on first use.
+        """
+        self.started = True
+        warm_urls = list(warm_urls)
+        if warm_urls:
+            self._warmup = asyncio.create_task(self.warm(warm_urls))
+
+    def _client(self, url: str) -> httpx.AsyncClient:
+        if not self.started:
+            raise RuntimeError("ClioOAuthClient.start() has not been called")
+        key = origin(url)
+        client = self.clients.get(key)
+        if client is None:
+            client = self.clients[key] = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT, pool=POOL_TIMEOUT),
+            )
+        return client
+
+    async def warm(self, urls: Iterable[str]) -> None:
+        """Open the pools for these URLs' origins and connect each one ahead of the first real request."""
+        async def connect(url: str) -> None:
+            try:
+                # Any response leaves a TLS connection in the pool; failures surface on real requests
+                await self._client(url).head(url, timeout=CONNECT_TIMEOUT)
+            except httpx.HTTPError:
+                pass
+
+        await asyncio.gather(*(connect(url) for url in {origin(url) + "/" for url in urls}))
+
+    async def close(self) -> None:
+        """Close every pool and its connections (called from app.on_shutdown)."""
+        if self._warmup is not None:
+            self._warmup.cancel()
+            self._warmup = None
+        clients, self.clients = list(self.clients.values()), {}
+        self.started = False
+        for client in clients:
+            await client.aclose()
+
+    async def post(self, url: str, data: Dict[str, str], headers: Optional[Dict[str, str]] = None,
+                   idempotent: bool = True) -> httpx.Response:
+        """POST a form payload over a pooled keep-alive connection, under the upstream policy.
+
+        Pass idempotent=False for single-use requests, which are then only retried if they were never sent.
+        """
+        self._client(url)
+        return await self.policy.send(
+            urlsplit(url).netloc, lambda: self._send_once("POST", url, data=data, headers=headers or FORM_HEADERS),
+            idempotent)
+
+    async def _send_once(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        endpoint = urlsplit(url).path.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = await self._client(url).request(method, url, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            UPSTREAM_LATENCY.observe(time.perf_counter() - start, endpoint, status)
+
+    async def refresh(self, url: str, client_id: str, client_secret: str, refresh_token: str) -> httpx.Response:
+        """Exchange a refresh token for a new access token."""
+        return await self.post(url, data={
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+        })
+
+    async def deauthorize(self, url: str, access_token: str) -> bool:
+        """Revoke a single access token, returning True when Clio accepted it."""
+        headers = {"Authorization": f"Bearer {access_token}", **FORM_HEADERS}
+        try:
+            response = await self.post(url, data={"token": access_token}, headers=headers, idempotent=False)
+        except httpx.HTTPError:
+            return False
+        return response.status_code == 200
+
+    async def probe(self, url: str, access_token: str) -> str:
+        """Call a lightweight API endpoint with a token: "valid", "invalid" (rejected by Clio) or "error"."""
+        self._client(url)
+        headers = {"Authorization": f"Bearer {access_token}"}
+        try:
+            response = await self.probe_policy.send(
+                urlsplit(url).netloc, lambda: self._send_once("GET", url, headers=headers))
+        except httpx.HTTPError:
+            return "error"
+        if response.status_code == 200:
+            return "valid"
+        return "invalid" if response.status_code in (401, 403) else "error"
+
+    async def _run_many(self, tokens: Dict[int, Tuple[str, str]], call: Callable[[str, str], Awaitable[Any]],
+                        concurrency: int, on_progress: Optional[Callable[[int, int], None]]) -> Dict[int, Any]:
+        """Run call(url, access_token) for every token with bounded concurrency and return the results by id."""
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        results: Dict[int, Any] = {}
+
+        async def run(token_id: int, url: str, access_token: str) -> None:
+            async with semaphore:
+                results[token_id] = await call(url, access_token)
+            if on_progress:
+                on_progress(len(results), len(tokens))
+
+        await asyncio.gather(*(run(token_id, url, access_token) for token_id, (url, access_token) in tokens.items()))
+        return results
+
+    async def deauthorize_many(self, tokens: Dict[int, Tuple[str, str]],
+                               concurrency: int = DEAUTHORIZE_CONCURRENCY,
+                               on_progress: Optional[Callable[[int, int], None]] = None) -> Set[int]:
+        """Revoke tokens ({id: (deauthorize_url, access_token)}) concurrently and return the ids that were deauthorized."""
+        results = await self._run_many(tokens, self.deauthorize, concurrency, on_progress)
+        return {token_id for token_id, deauthorized in results.items() if deauthorized}
+
+    async def probe_many(self, tokens: Dict[int, Tuple[str, str]], concurrency: int = PROBE_CONCURRENCY,
+                         on_progress: Optional[Callable[[int, int], None]] = None) -> Dict[int, str]:
+        """Probe tokens ({id: (probe_url, access_token)}) concurrently and return each token's status."""
+        return await self._run_many(tokens, self.probe, concurrency, on_progress)
@@ -0,0 +1,61 @@
+import os
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit
+
+# Clio serves each data region from its own host
+REGION_BASE_URLS = {
+    "us": "https://app.clio.com",
+    "ca": "https://ca.app.clio.com",
+    "eu": "https://eu.app.clio.com",
+    "au": "https://au.app.clio.com",
+}
+
+# Region of gateways and tokens stored without one (everything created before regions existed)
+DEFAULT_REGION = os.getenv("DEFAULT_REGION", "us")
+
+
+class ClioEndpoints(NamedTuple):
+    auth_url: str
+    token_url: str
+    deauthorize_url: str
+    probe_url: str
+
+
+def base_url(region: Optional[str]) -> str:
+    """Base URL for a region code or a custom base URL (e.g. a mock server); empty means DEFAULT_REGION."""
+    region = (region or DEFAULT_REGION).strip()
+    if region.lower() in REGION_BASE_URLS:
+        return REGION_BASE_URLS[region.lower()]
+    if urlsplit(region).scheme in ("http", "https") and urlsplit(region).netloc:
+        return region.rstrip("/")
+    raise ValueError(f"Unknown Clio region: {region}")
+
+
+def is_valid_region(region: Optional[str]) -> bool:
+    try:
+        base_url(region)
+    except ValueError:
+        return False
+    return True
+
+
+def endpoints(region: Optional[str]) -> ClioEndpoints:
+    """OAuth and API endpoints of a region.
+
+    AUTH_BASE_URL, TOKEN_URL, DEAUTHORIZE_URL and PROBE_URL still override the
+    default region's endpoints, e.g. to point a single-region setup at a mock.
+    """
+    base = base_url(region)
+    default = base_url(None) == base
+    return ClioEndpoints(
+        (default and os.getenv("AUTH_BASE_URL")) or f"{base}/oauth/authorize",
+        (default and os.getenv("TOKEN_URL")) or f"{base}/oauth/token",
+        (default and os.getenv("DEAUTHORIZE_URL")) or f"{base}/oauth/deauthorize",
+        (default and os.getenv("PROBE_URL")) or f"{base}/api/v4/users/who_am_i",
+    )
+
+
+def origin(url: str) -> str:
+    """scheme://host[:port] of a URL; connection pools are kept per origin."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import secrets
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Collection, Deque, Dict, List, Optional, Tuple
+
+from journal import fingerprint
+from token_store import TokenStore
+
+# Events kept for subscribers that reconnect with a Last-Event-ID
+FEED_BUFFER_SIZE = 10_000
+# A comment line is sent after this many idle seconds so proxies keep the stream open
+KEEPALIVE_INTERVAL = 15.0
+# Reconnect delay suggested to EventSource clients, in milliseconds
+RETRY_MS = 3000
+
+
+class EventFeed:
+    """Broadcasts token issued, refreshed, invalid and revoked events to Server-Sent Events subscribers.
+
+    Every subscriber reads the same bounded buffer with its own cursor, so a
+    store change is serialized once however many streams are open. Event ids
+    are "<epoch>-<seq>"; a Last-Event-ID from another process or older than
+    the buffer gets a "reset" event telling the client to refetch its tokens.
+    """
+
+    def __init__(self, store: TokenStore, size: int = FEED_BUFFER_SIZE,
+                 keepalive: float = KEEPALIVE_INTERVAL) -> None:
+        self.epoch = secrets.token_hex(4)
+        self.keepalive = keepalive
+        self.seq = 0
+        self.buffer: Deque[Tuple[int, str, str]] = deque(maxlen=size)  # (seq, api_gateway, encoded event)
+        self.subscribers = 0
+        self._published = asyncio.Event()
+        store.add_listener(self.handle_change)
+
+    def handle_change(self, table: str, action: str, rows: List[Dict[str, Any]]) -> None:
+        if table != "access_tokens":
+            return
+        for row in rows:
+            if action == "added":
+                event = "token_issued"
+            elif action == "removed":
+                event = "token_revoked"
+            elif row["status"] == "invalid":
+                event = "token_invalid"
+            elif row["checked_at"] is None:
+                # Rotating a token clears its health-check result
+                event = "token_refreshed"
+            else:
+                continue
+            self.publish(event, row)
+
+    def publish(self, event: str, token: Dict[str, Any]) -> None:
+        self.seq += 1
+        data = json.dumps({"token_id": token["id"], "api_gateway": token["api_gateway"],
+                           "fingerprint": fingerprint(token["access_token"]),
+                           "expires_at": token["expires_at"], "time": time.time()})
+        self.buffer.append((self.seq, token["api_gateway"],
+                            f"id: {self.epoch}-{self.seq}\nevent: {event}\ndata: {data}\n\n"))
+        # Wake every waiting subscriber at once; later waits use a fresh event
+        self._published.set()
+        self._published = asyncio.Event()
+
+    def _resume_seq(self, last_event_id: Optional[str]) -> Optional[int]:
+        """Sequence number to continue after, or None if the id cannot be resumed from the buffer."""
+        if not last_event_id:
+            return self.seq
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        oldest = self.buffer[0][0] if self.buffer else self.seq + 1
+        return int(seq) if int(seq) + 1 >= oldest else None
+
+    async def stream(self, api_gateways: Collection[str] = (), last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Yield SSE-encoded events for the given gateways (all when empty), starting after last_event_id."""
+        self.subscribers += 1
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            cursor = self._resume_seq(last_event_id)
+            if cursor is None:
+                cursor = self.seq
+                yield f"id: {self.epoch}-{cursor}\nevent: reset\ndata: {{}}\n\n"
+            while True:
+                published = self._published
+                if not self.buffer or self.buffer[-1][0] <= cursor:
+                    try:
+                        await asyncio.wait_for(published.wait(), self.keepalive)
+                    except asyncio.TimeoutError:
+                        yield ": keepalive\n\n"
+                    continue
+                if self.buffer[0][0] > cursor + 1:
+                    # This subscriber fell behind the buffer
+                    cursor = self.seq
+                    yield f"id: {self.epoch}-{cursor}\nevent: reset\ndata: {{}}\n\n"
+                    continue
+                # Sequence numbers are contiguous, so the first unread event is at a known offset
+                start = cursor + 1 - self.buffer[0][0]
+                events = [self.buffer[i] for i in range(start, len(self.buffer))]
+                cursor = events[-1][0]
+                chunk = "".join(encoded for _, api_gateway, encoded in events
+                                if not api_gateways or api_gateway in api_gateways)
+                if chunk:
+                    yield chunk
+        finally:
+            self.subscribers -= 1
@@ -4,6 +4,7 @@ from urllib.parse import urlencode
 import os
 
 from routes.routes import token_routes, update_app, set_globals
+from db import pool
 
 load_dotenv()
 
@@ -12,6 +13,9 @@ app.secret_key = os.urandom(24)
 
 app.register_blueprint(token_routes)
 
+# Return each request thread's SQLite connection to the pool when the request ends
+pool.init_app(app)
+
 # OAuth 2.0 Configuration
 client_id = os.getenv("CLIENT_ID", "").strip()
 client_secret = os.getenv("CLIENT_SECRET", "").strip()
@@ -73,4 +77,4 @@ if __name__ == '__main__':
     FLASK_HOST = os.getenv("FLASK_HOST", "127.0.0.1")
     FLASK_PORT = os.getenv("FLASK_PORT", 5000)
     FLASK_DEBUG = os.getenv("FLASK_DEBUG", True)
-    app.run(host=FLASK_HOST, debug=FLASK_DEBUG, port=FLASK_PORT, use_reloader=False)
+    app.run(host=FLASK_HOST, debug=FLASK_DEBUG, port=FLASK_PORT, use_reloader=False, threaded=True)
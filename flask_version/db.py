@@ -0,0 +1,143 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+DATABASE_PATH = os.getenv("DATABASE_PATH", "clio_api.db")
+
+# Idle connections kept for reuse, and prepared statements cached per connection
+POOL_SIZE = 16
+STATEMENT_CACHE_SIZE = 128
+BUSY_TIMEOUT = 5.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clio_api_gateway (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    client_id TEXT NOT NULL,
+    client_secret TEXT NOT NULL,
+    redirect_uri TEXT,
+    created_at REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_clio_api_gateway_client_id ON clio_api_gateway (client_id);
+
+CREATE TABLE IF NOT EXISTS clio_api_token (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    gateway_id INTEGER NOT NULL REFERENCES clio_api_gateway (id) ON DELETE CASCADE,
+    access_token TEXT NOT NULL,
+    refresh_token TEXT,
+    expires_at TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_clio_api_token_gateway ON clio_api_token (gateway_id, created_at);
+"""
+
+# Tables and columns that may be read or written; table and column names are never taken from input as-is
+TABLES = {
+    "clio_api_gateway": ("id", "name", "client_id", "client_secret", "redirect_uri", "created_at"),
+    "clio_api_token": ("id", "gateway_id", "access_token", "refresh_token", "expires_at", "created_at"),
+}
+
+
+class ConnectionPool:
+    """Thread-safe SQLite pool: each thread holds its own connection until release() returns it for reuse."""
+
+    def __init__(self, path: str = DATABASE_PATH, size: int = POOL_SIZE) -> None:
+        self.path = path
+        self.idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=size)
+        self.local = threading.local()
+        # The database file and schema are created by the first request that needs them, not on import
+        self.schema_lock = threading.Lock()
+        self.schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections move between threads only through the pool, never while in use
+        connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                                     cached_statements=STATEMENT_CACHE_SIZE)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        if not self.schema_ready:
+            with self.schema_lock:
+                if not self.schema_ready:
+                    connection.executescript(SCHEMA)
+                    self.schema_ready = True
+        return connection
+
+    def connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, taking an idle one from the pool or opening a new one."""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+            self.local.connection = connection
+        return connection
+
+    def release(self, _exception: Optional[BaseException] = None) -> None:
+        """Give this thread's connection back to the pool (registered as a Flask teardown handler)."""
+        connection = self.local.__dict__.pop("connection", None)
+        if connection is None:
+            return
+        if connection.in_transaction:
+            connection.rollback()
+        try:
+            self.idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def init_app(self, app) -> None:
+        app.teardown_appcontext(self.release)
+
+    def insert(self, table: str, data: Dict[str, Any]) -> int:
+        """Insert a row and return its primary key."""
+        # Same columns give the same SQL text, so the statement is reused from the connection's cache
+        sql, values = _insert_statement(table, data)
+        connection = self.connection()
+        with connection:
+            return connection.execute(sql, values).lastrowid
+
+    def get_or_insert(self, table: str, data: Dict[str, Any], key: str) -> int:
+        """Return the primary key of the row whose unique `key` column matches data, inserting data if there is none."""
+        sql, values = _insert_statement(table, data)
+        if key not in data:
+            raise ValueError(f"{key} is required")
+        connection = self.connection()
+        with connection:
+            # Concurrent requests for the same key both end up with the one stored row
+            connection.execute(f"{sql} ON CONFLICT ({key}) DO NOTHING", values)
+            return connection.execute(f"SELECT id FROM {table} WHERE {key} = ?", (data[key],)).fetchone()["id"]
+
+    def get(self, table: str, row_id: int) -> Optional[Dict[str, Any]]:
+        _check_table(table)
+        row = self.connection().execute(f"SELECT * FROM {table} WHERE id = ?", (row_id,)).fetchone()
+        return dict(row) if row else None
+
+
+def _check_table(table: str) -> None:
+    if table not in TABLES:
+        raise ValueError(f"Unknown table: {table}")
+
+
+def _columns(table: str, data: Dict[str, Any]) -> List[str]:
+    _check_table(table)
+    unknown = set(data) - set(TABLES[table])
+    if unknown:
+        raise ValueError(f"Unknown columns for {table}: {', '.join(sorted(unknown))}")
+    return sorted(data)
+
+
+def _insert_statement(table: str, data: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    columns = _columns(table, data)
+    values = [data[column] for column in columns]
+    if "created_at" in TABLES[table] and "created_at" not in data:
+        columns.append("created_at")
+        values.append(time.time())
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values
+
+
+pool = ConnectionPool()
@@ -0,0 +1,15 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+# Keep-alive connections per host, sized for a multi-threaded WSGI server
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 32
+
+# (connect, read) timeouts in seconds for every call to Clio
+REQUEST_TIMEOUT = (5, 15)
+
+# One session for the whole process, so token exchanges reuse TCP/TLS connections
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
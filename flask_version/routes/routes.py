@@ -3,8 +3,12 @@ import os
 import base64
 import requests
 
+from datetime import datetime, timedelta, timezone
 from urllib.parse import urlencode
 
+from db import pool
+from http_client import session as http, REQUEST_TIMEOUT
+
 # OAuth 2.0 Configuration
 client_id = None
 client_secret = None
@@ -34,25 +38,55 @@ def set_globals():
     token_url = os.getenv("TOKEN_URL")
     deauthorize_url = os.getenv("DEAUTHORIZE_URL")    
     
-@token_routes.route('/authorize')
-def authorize():
-    """Start the OAuth process or prompt for missing variables."""
-    if not client_id or not client_secret or client_id == "ChangeMe" or client_secret == "ChangeMe":
-        return redirect(url_for('index', missing_env=True))
-    
-    # Continue with OAuth process
+def start_oauth(gateway_client_id, gateway_redirect_uri):
+    """Remember a new state in the session and redirect to Clio's authorization page."""
     state = base64.urlsafe_b64encode(os.urandom(30)).decode('utf-8')
     session['oauth_state'] = state
     params = {
         "response_type": "code",
-        "client_id": client_id,
-        "redirect_uri": redirect_uri,
+        "client_id": gateway_client_id,
+        "redirect_uri": gateway_redirect_uri,
         "state": state,
     }
     print(params)
     authorization_url = f"{authorization_base_url}?{urlencode(params)}"
     return redirect(authorization_url)
 
+def current_gateway():
+    """The gateway of the login in progress: the one picked at /auth/<app_id>, else the configured app."""
+    app_id = session.get('app_id')
+    if app_id is not None:
+        return pool.get("clio_api_gateway", app_id)
+    if not client_id or not client_secret:
+        return None
+    gateway_id = pool.get_or_insert("clio_api_gateway", {
+        "name": client_id,
+        "client_id": client_id,
+        "client_secret": client_secret,
+        "redirect_uri": redirect_uri,
+    }, "client_id")
+    # The configured credentials may have been changed through /set_env since the row was stored
+    return {"id": gateway_id, "client_id": client_id, "client_secret": client_secret, "redirect_uri": redirect_uri}
+
+@token_routes.route('/authorize')
+def authorize():
+    """Start the OAuth process or prompt for missing variables."""
+    if not client_id or not client_secret or client_id == "ChangeMe" or client_secret == "ChangeMe":
+        return redirect(url_for('index', missing_env=True))
+
+    # Continue with OAuth process
+    session.pop('app_id', None)
+    return start_oauth(client_id, redirect_uri)
+
+@token_routes.route('/auth/<int:app_id>')
+def authenticate_app(app_id):
+    """Start the OAuth process for a stored gateway."""
+    gateway = pool.get("clio_api_gateway", app_id)
+    if not gateway:
+        return "Application not found", 404
+    session['app_id'] = app_id
+    return start_oauth(gateway["client_id"], gateway["redirect_uri"] or redirect_uri)
+
 @token_routes.route('/callback')
 def callback():
     if request.args.get('state') != session.pop('oauth_state', None):
@@ -62,19 +96,30 @@ def callback():
     if not authorization_code:
         return "Error: Missing authorization code", 400
 
+    gateway = current_gateway()
+    if not gateway:
+        return "Error: Application not found", 404
+
     data = {
         "grant_type": "authorization_code",
         "code": authorization_code,
-        "redirect_uri": redirect_uri,
-        "client_id": client_id,
-        "client_secret": client_secret,
+        "redirect_uri": gateway["redirect_uri"] or redirect_uri,
+        "client_id": gateway["client_id"],
+        "client_secret": gateway["client_secret"],
     }
-    response = requests.post(token_url, data=data)
+    response = http.post(token_url, data=data, timeout=REQUEST_TIMEOUT)
     if response.status_code != 200:
         return f"Failed to obtain token: {response.text}", 400
 
     token_response = response.json()
     if "access_token" in token_response:
+        expires_in = token_response.get("expires_in")
+        pool.insert("clio_api_token", {
+            "gateway_id": gateway["id"],
+            "access_token": token_response["access_token"],
+            "refresh_token": token_response.get("refresh_token"),
+            "expires_at": (datetime.now(timezone.utc) + timedelta(seconds=expires_in)).isoformat() if expires_in else None,
+        })
 
         return render_template(
             'callback.html',
@@ -103,7 +148,7 @@ def refresh_token():
     }
 
     # Send POST request to the token endpoint
-    response = requests.post(token_url, data=data)
+    response = http.post(token_url, data=data, timeout=REQUEST_TIMEOUT)
 
     # Handle response
     if response.status_code == 200:
@@ -122,7 +167,7 @@ def revoke_token():
     data = {"token": token}
 
     try:
-        response = requests.post(deauthorize_url, data=data, auth=(client_id, client_secret), timeout=10)
+        response = http.post(deauthorize_url, data=data, auth=(client_id, client_secret), timeout=REQUEST_TIMEOUT)
 
         if response.status_code == 200:
             return jsonify({"message": "Token successfully revoked"})
@@ -0,0 +1,129 @@
+import json
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from grid_model import page_rows
+from token_store import GATEWAY_COLUMNS, GRID_FIELDS, TokenStore
+
+# Grid windows kept per model version; identical requests from any session are answered from here
+PAGE_CACHE_SIZE = 64
+
+
+def build_column_definitions() -> List[Dict[str, Any]]:
+    """Build the API gateway grid columns from GATEWAY_COLUMNS."""
+    column_definitions = []
+    for col in GATEWAY_COLUMNS:
+        col_field = col.lower().replace(" ", "_")
+
+        # Custom properties for ID column
+        if col == "ID":
+            column_definitions.append({
+                "headerName": col,
+                "field": col_field,
+                "editable": False,
+                "checkboxSelection": True,
+                "width": 30,  # Fixed width for ID column
+                "resizable": True,
+                "filter": "agNumberColumnFilter"
+            })
+        else:
+            column_definitions.append({
+                "headerName": col,
+                "field": col_field,
+                "editable": True
+            })
+    return column_definitions
+
+
+class GatewayRecord:
+    """Compact read-only gateway row; supports row[field] so it can be paged like a dict."""
+
+    __slots__ = ("id", "name", "client_id", "client_secret", "region")
+
+    def __init__(self, row: Dict[str, Any]) -> None:
+        for field in self.__slots__:
+            object.__setattr__(self, field, row.get(field))
+
+    def __setattr__(self, field: str, value: Any) -> None:
+        raise AttributeError("GatewayRecord is read-only")
+
+    def __getitem__(self, field: str) -> Any:
+        return getattr(self, field)
+
+    def matches(self, row: Dict[str, Any]) -> bool:
+        return all(getattr(self, field) == row.get(field) for field in self.__slots__)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class GatewayModel:
+    """Process-wide, versioned read model of the API gateway grid, shared by every session.
+
+    Records are loaded once and kept current from store change notifications;
+    the version only moves when a gateway actually changes, which also drops
+    the cached grid windows. Writes the listeners never hear of (another
+    process on a local store, or a replay still pending) move the store's
+    gateways_version, which is checked before every window and reloads them.
+    """
+
+    def __init__(self, store: TokenStore, page_cache_size: int = PAGE_CACHE_SIZE) -> None:
+        self.store = store
+        self.page_cache_size = page_cache_size
+        self.version = 0
+        # store.gateways_version() when the records were last loaded
+        self.storage_version: Optional[int] = None
+        self.column_definitions = build_column_definitions()
+        self.records: Optional[Dict[int, GatewayRecord]] = None
+        self.pages: "OrderedDict[str, Tuple[List[Dict[str, Any]], int]]" = OrderedDict()
+        store.add_listener(self.handle_change)
+
+    def _records(self) -> Dict[int, GatewayRecord]:
+        storage_version = self.store.gateways_version()
+        if self.records is None or storage_version != self.storage_version:
+            # Read the version first, so a write racing the reload triggers another one
+            self.storage_version = storage_version
+            records = {row["id"]: GatewayRecord(row) for row in self.store.iter_rows("api_gateways")}
+            if self.records is not None and (records.keys() != self.records.keys() or any(
+                    not record.matches(self.records[record.id].as_dict()) for record in records.values())):
+                self.version += 1
+                self.pages.clear()
+            self.records = records
+        return self.records
+
+    def handle_change(self, table: str, action: str, rows: List[Dict[str, Any]]) -> None:
+        if table != "api_gateways" or self.records is None:
+            return
+        changed = False
+        for row in rows:
+            if action == "removed":
+                changed |= self.records.pop(row["id"], None) is not None
+            elif action == "updated" and row["id"] not in self.records:
+                # An edit that raced a delete must not bring the gateway back
+                continue
+            else:
+                record = self.records.get(row["id"])
+                if record is None or not record.matches(row):
+                    self.records[row["id"]] = GatewayRecord(row)
+                    changed = True
+        if changed:
+            self.version += 1
+            self.pages.clear()
+
+    def page(self, start: int, end: int, sort_model: Optional[List[Dict[str, str]]] = None,
+             filter_model: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Return one window of the gateway grid; the result is shared and must not be modified."""
+        records = self._records()
+        key = json.dumps([start, end, sort_model, filter_model], sort_keys=True)
+        result = self.pages.get(key)
+        if result is not None:
+            self.pages.move_to_end(key)
+            return result
+
+        ordered = sorted(records.values(), key=lambda record: record.id)
+        window, last_row = page_rows(ordered, GRID_FIELDS["api_gateways"], start, end, sort_model, filter_model)
+        result = [record.as_dict() for record in window], last_row
+        self.pages[key] = result
+        if len(self.pages) > self.page_cache_size:
+            self.pages.popitem(last=False)
+        return result
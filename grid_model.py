@@ -0,0 +1,124 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Rows fetched per request and blocks kept in the browser by the infinite row model
+GRID_BLOCK_SIZE = 100
+GRID_MAX_BLOCKS = 10
+
+GRID_ENDPOINT = "/api/grid/{table}"
+
+# Grid columns computed in the browser as time from now, mapped to (stored column, seconds per unit)
+RELATIVE_TIME_FIELDS = {"expires_in": ("expires_at", 86400)}
+
+# AG Grid datasource that asks the server for one window of rows with the current sort and filter
+DATASOURCE = """({
+    getRows(params) {
+        fetch("%s", {
+            method: "POST",
+            headers: {"Content-Type": "application/json"},
+            body: JSON.stringify({
+                startRow: params.startRow,
+                endRow: params.endRow,
+                sortModel: params.sortModel,
+                filterModel: params.filterModel,
+            }),
+        })
+            .then((response) => response.json())
+            .then((page) => params.successCallback(page.rows, page.lastRow))
+            .catch(() => params.failCallback());
+    }
+})"""
+
+
+def infinite_grid_options(table: str, column_definitions: List[Dict[str, Any]], **options: Any) -> Dict[str, Any]:
+    """AG Grid options for a grid whose rows are paged, sorted and filtered by the server."""
+    return {
+        "columnDefs": column_definitions,
+        "defaultColDef": {"sortable": True, "filter": "agTextColumnFilter"},
+        "rowModelType": "infinite",
+        "cacheBlockSize": GRID_BLOCK_SIZE,
+        "maxBlocksInCache": GRID_MAX_BLOCKS,
+        ":getRowId": "(params) => String(params.data.id)",
+        ":datasource": DATASOURCE % GRID_ENDPOINT.format(table=table),
+        **options,
+    }
+
+
+def apply_changes(grid: Any, action: str, rows: List[Dict[str, Any]], fields: Sequence[str]) -> None:
+    """Push a store change to an infinite-model grid, touching only the affected rows and shown columns."""
+    if action == "updated" and len(rows) <= GRID_BLOCK_SIZE:
+        for row in grid_rows(rows, fields):
+            grid.run_row_method(str(row["id"]), "setData", row)
+    else:
+        # The infinite row model has no add/remove transactions (and bulk updates are cheaper
+        # to re-fetch than to push row by row); re-fetch only the cached window
+        grid.run_grid_method("refreshInfiniteCache")
+
+
+def grid_rows(rows: Iterable[Dict[str, Any]], fields: Sequence[str]) -> List[Dict[str, Any]]:
+    """Strip store rows down to the columns a grid shows."""
+    return [{field: row[field] for field in fields} for row in rows]
+
+
+def resolve_relative_fields(sort_model: Optional[List[Dict[str, str]]], filter_model: Optional[Dict[str, Any]],
+                            now: float) -> Tuple[Optional[List[Dict[str, str]]], Optional[Dict[str, Any]]]:
+    """Rewrite sorts and number filters on RELATIVE_TIME_FIELDS into their stored, indexed columns."""
+    def shift(model: Dict[str, Any], unit: float) -> Dict[str, Any]:
+        if "conditions" in model:
+            return {**model, "conditions": [shift(condition, unit) for condition in model["conditions"]]}
+        if model.get("filterType") == "number" and model.get("filter") is not None:
+            return {**model, "filter": now + model["filter"] * unit}
+        return model
+
+    if sort_model:
+        sort_model = [{**sort, "colId": RELATIVE_TIME_FIELDS[sort["colId"]][0]}
+                      if sort.get("colId") in RELATIVE_TIME_FIELDS else sort for sort in sort_model]
+    if filter_model:
+        filter_model = dict(filter_model)
+        for field, (stored, unit) in RELATIVE_TIME_FIELDS.items():
+            if field in filter_model:
+                filter_model[stored] = shift(filter_model.pop(field), unit)
+    return sort_model, filter_model
+
+
+def page_rows(rows: Sequence[Any], fields: Sequence[str], start: int, end: int,
+              sort_model: Optional[List[Dict[str, str]]] = None,
+              filter_model: Optional[Dict[str, Any]] = None) -> Tuple[List[Any], int]:
+    """Filter, sort and slice in-memory rows with the same semantics as the SQL grid queries."""
+    rows = list(rows)
+    for field, model in (filter_model or {}).items():
+        if field in fields:
+            rows = [row for row in rows if matches_filter(row[field], model)]
+    # Stable sorts applied from the last sort column to the first; NULLs sort first as in SQLite
+    for sort in reversed([sort for sort in sort_model or [] if sort.get("colId") in fields]):
+        field = sort["colId"]
+        rows.sort(key=lambda row: (row[field] is not None, 0 if row[field] is None else row[field]),
+                  reverse=sort.get("sort") == "desc")
+    window = rows[max(0, start):max(0, end)]
+    return window, len(rows) if max(0, end) >= len(rows) else -1
+
+
+def matches_filter(value: Any, model: Dict[str, Any]) -> bool:
+    """Evaluate one AG Grid column filter model against a value (same semantics as the SQL filters)."""
+    if "conditions" in model:
+        results = [matches_filter(value, condition) for condition in model["conditions"]]
+        return any(results) if model.get("operator") == "OR" else all(results)
+
+    target = model.get("filter")
+    kind = model.get("type")
+    if model.get("filterType") == "number":
+        if target is None or value is None:
+            return target is None
+        return {
+            "equals": value == target, "notEqual": value != target,
+            "lessThan": value < target, "lessThanOrEqual": value <= target,
+            "greaterThan": value > target, "greaterThanOrEqual": value >= target,
+        }.get(kind, True)
+
+    if target in (None, ""):
+        return True
+    text, target = str(value or "").lower(), str(target).lower()
+    return {
+        "contains": target in text, "notContains": target not in text,
+        "startsWith": text.startswith(target), "endsWith": text.endswith(target),
+        "equals": text == target, "notEqual": text != target,
+    }.get(kind, True)
@@ -0,0 +1,282 @@
+import asyncio
+import contextvars
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+log = logging.getLogger(__name__)
+
+JOURNAL_DIR = os.path.join(".nicegui", "journal")
+# Lock file that gives one process at a time a journal directory
+LOCK_FILE = ".lock"
+
+# Buffered events are appended at least this often, or sooner once this many are queued
+JOURNAL_FLUSH_INTERVAL = 1.0
+JOURNAL_FLUSH_SIZE = 500
+
+# A snapshot of the replayed state is written, and a new segment started, after this many events
+SNAPSHOT_EVERY = 10_000
+# Segments (and snapshots) fully covered by a newer snapshot are deleted after this long (None keeps them)
+JOURNAL_RETENTION: Optional[float] = None
+
+# Token values never reach the journal; they are recorded as short fingerprints
+SECRET_FIELDS = ("access_token", "refresh_token", "client_secret")
+
+# Health checks only touch status columns and are not lifecycle events
+UNJOURNALED_ACTORS = {"health_check"}
+
+# Who causes the changes made in the current context (e.g. "oauth_callback", "ui:127.0.0.1")
+actor: contextvars.ContextVar[str] = contextvars.ContextVar("journal_actor", default="system")
+
+
+@contextmanager
+def acting_as(name: str) -> Iterator[None]:
+    """Attribute store changes made inside the block to `name`."""
+    token = actor.set(name)
+    try:
+        yield
+    finally:
+        actor.reset(token)
+
+
+def fingerprint(value: Optional[str]) -> Optional[str]:
+    return None if value is None else "sha256:" + hashlib.sha256(value.encode()).hexdigest()[:16]
+
+
+def _redact(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: fingerprint(value) if field in SECRET_FIELDS else value for field, value in row.items()}
+
+
+class JournalLockedError(RuntimeError):
+    """Raised when another process is already writing to a journal directory."""
+
+
+def _lock_directory(directory: str) -> Optional[IO[str]]:
+    """Take the directory's lock without waiting; returns the open lock file, or None if another process holds it."""
+    os.makedirs(directory, exist_ok=True)
+    lock = open(os.path.join(directory, LOCK_FILE), "a+")
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock.close()
+        return None
+    return lock
+
+
+def apply_event(state: Dict[str, Dict[int, Dict[str, Any]]], event: Dict[str, Any]) -> None:
+    """Apply one journal event to a {table: {id: row}} state."""
+    rows = state.setdefault(event["table"], {})
+    if event["action"] == "removed":
+        rows.pop(event["row"]["id"], None)
+    else:
+        rows[event["row"]["id"]] = {**rows.get(event["row"]["id"], {}), **event["row"]}
+
+
+class Journal:
+    """Append-only lifecycle journal of gateway and token changes, written by a buffered async writer.
+
+    Events go to JSONL segments; every SNAPSHOT_EVERY events the replayed state
+    is compacted into a snapshot, so state() only replays the events after it.
+
+    A directory is written by one process at a time (it numbers the events).
+    If another process holds it, JournalLockedError is raised, or with
+    per_worker the first free "worker-N" subdirectory is used instead.
+    """
+
+    def __init__(self, store: Any, directory: str = JOURNAL_DIR, flush_interval: float = JOURNAL_FLUSH_INTERVAL,
+                 snapshot_every: int = SNAPSHOT_EVERY, retention: Optional[float] = JOURNAL_RETENTION,
+                 per_worker: bool = False) -> None:
+        self._lock = _lock_directory(directory)
+        worker = 0
+        while self._lock is None:
+            if not per_worker:
+                raise JournalLockedError(f"Another process is writing the journal in {directory}; "
+                                         "give each worker its own JOURNAL_DIR")
+            worker += 1
+            self._lock = _lock_directory(os.path.join(directory, f"worker-{worker}"))
+        if worker:
+            directory = os.path.join(directory, f"worker-{worker}")
+        self.store = store
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.retention = retention
+        self.buffer: List[Dict[str, Any]] = []
+        self.seq = 0
+        self.segment_start = 1
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._recover()
+        store.add_listener(self.handle_change)
+
+    # Files
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        paths = glob.glob(os.path.join(self.directory, "events-*.jsonl"))
+        return sorted((int(os.path.basename(path)[7:-6]), path) for path in paths)
+
+    def _snapshots(self) -> List[Tuple[int, str]]:
+        paths = glob.glob(os.path.join(self.directory, "snapshot-*.json"))
+        return sorted((int(os.path.basename(path)[9:-5]), path) for path in paths)
+
+    def _segment_path(self, start: int) -> str:
+        return os.path.join(self.directory, f"events-{start:012d}.jsonl")
+
+    def _recover(self) -> None:
+        """Continue numbering after the last event on disk."""
+        segments = self._segments()
+        snapshots = self._snapshots()
+        self.seq = snapshots[-1][0] if snapshots else 0
+        if segments:
+            self.segment_start = segments[-1][0]
+            for event in self._read(segments[-1][1]):
+                self.seq = max(self.seq, event["seq"])
+        if not segments or self.seq - self.segment_start + 1 >= self.snapshot_every:
+            self.segment_start = self.seq + 1
+
+    @staticmethod
+    def _read(path: str) -> Iterator[Dict[str, Any]]:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash can leave one partial line at the end of a segment
+                        log.warning("Skipping corrupt journal line in %s", path)
+
+    # Writing
+
+    def handle_change(self, table: str, action: str, rows: List[Dict[str, Any]]) -> None:
+        # Changes replayed from other workers are journaled by the worker that made them
+        if getattr(self.store, "replaying", False) or actor.get() in UNJOURNALED_ACTORS:
+            return
+        now = time.time()
+        for row in rows:
+            self.seq += 1
+            self.buffer.append({"seq": self.seq, "ts": now, "actor": actor.get(), "table": table,
+                                "action": action, "row": _redact(row)})
+        if len(self.buffer) >= JOURNAL_FLUSH_SIZE:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Append buffered events to the current segment and compact when it is full; returns events written."""
+        if not self.buffer:
+            return 0
+        events, self.buffer = self.buffer, []
+        written = 0
+        while written < len(events):
+            room = self.snapshot_every - (events[written]["seq"] - self.segment_start)
+            chunk = events[written:written + max(1, room)]
+            with open(self._segment_path(self.segment_start), "a") as f:
+                f.write("".join(json.dumps(event) + "\n" for event in chunk))
+            written += len(chunk)
+            if chunk[-1]["seq"] - self.segment_start + 1 >= self.snapshot_every:
+                self.compact(chunk[-1]["seq"])
+        return written
+
+    def compact(self, seq: int) -> None:
+        """Write a snapshot of the state after event `seq`, start a new segment and prune old files."""
+        state = self.state(until_seq=seq)
+        path = os.path.join(self.directory, f"snapshot-{seq:012d}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"seq": seq, "ts": time.time(),
+                       "state": {table: list(rows.values()) for table, rows in state.items()}}, f)
+        os.replace(path + ".tmp", path)
+        self.segment_start = seq + 1
+        self._prune()
+
+    def _prune(self) -> None:
+        if self.retention is None:
+            return
+        cutoff = time.time() - self.retention
+        snapshots = self._snapshots()
+        if not snapshots:
+            return
+        latest = snapshots[-1][0]
+        for start, path in self._segments():
+            if start <= latest and os.path.getmtime(path) < cutoff and start != self.segment_start:
+                os.remove(path)
+        for seq, path in snapshots[:-1]:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except OSError:
+                log.exception("Writing the journal failed")
+
+    async def start(self) -> None:
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        self.flush()
+
+    # Reading
+
+    def events(self, table: Optional[str] = None, row_id: Optional[int] = None, since: Optional[float] = None,
+               until: Optional[float] = None, after_seq: int = 0) -> Iterator[Dict[str, Any]]:
+        """Yield journaled events in order, optionally for one table, one row or a time range."""
+        for event in self._logged(after_seq):
+            if event["seq"] <= after_seq:
+                continue
+            if table is not None and event["table"] != table:
+                continue
+            if row_id is not None and event["row"].get("id") != row_id:
+                continue
+            if since is not None and event["ts"] < since:
+                continue
+            if until is not None and event["ts"] > until:
+                return
+            yield event
+
+    def _logged(self, after_seq: int) -> Iterator[Dict[str, Any]]:
+        """Yield the events on disk from the segment holding after_seq on, then the buffered ones."""
+        segments = self._segments()
+        for i, (start, path) in enumerate(segments):
+            # Skip whole segments that end before after_seq
+            if i + 1 < len(segments) and segments[i + 1][0] <= after_seq + 1:
+                continue
+            yield from self._read(path)
+        yield from list(self.buffer)
+
+    def state(self, until_seq: Optional[int] = None) -> Dict[str, Dict[int, Dict[str, Any]]]:
+        """Rebuild {table: {id: row}} from the latest snapshot plus the events journaled after it."""
+        state: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        after_seq = 0
+        snapshots = [snapshot for snapshot in self._snapshots() if until_seq is None or snapshot[0] <= until_seq]
+        if snapshots:
+            with open(snapshots[-1][1]) as f:
+                snapshot = json.load(f)
+            after_seq = snapshot["seq"]
+            state = {table: {row["id"]: row for row in rows} for table, rows in snapshot["state"].items()}
+        for event in self.events(after_seq=after_seq):
+            if until_seq is not None and event["seq"] > until_seq:
+                break
+            apply_event(state, event)
+        return state
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds and size buckets in bytes
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# How often the event loop monitor schedules itself; the overshoot is the loop's lag
+EVENT_LOOP_PROBE_INTERVAL = 0.1
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Iterable) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Prometheus histogram; observe() is a bisect and three additions."""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Labels, List] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += bucket_count
+                labels = _format_labels([*self.labels, "le"], [*label_values, bound])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge:
+    """Prometheus gauge whose values are collected by a callback at scrape time."""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 collect: Callable[[], Dict[Labels, float]] = dict) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for label_values, value in self.collect().items():
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self) -> None:
+        self.metrics: List = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+UPSTREAM_LATENCY = REGISTRY.register(Histogram(
+    "clio_upstream_request_duration_seconds", "Latency of calls to Clio OAuth endpoints.", ["endpoint", "status"]))
+CALLBACK_LATENCY = REGISTRY.register(Histogram(
+    "clio_callback_duration_seconds", "End-to-end duration of /callback token exchanges.", ["result"]))
+STORAGE_FLUSH_LATENCY = REGISTRY.register(Histogram(
+    "token_store_flush_duration_seconds", "Duration of token store write transactions.", ["operation"]))
+STORAGE_FLUSH_BYTES = REGISTRY.register(Histogram(
+    "token_store_flush_bytes", "Bytes appended to the SQLite write-ahead log per transaction.", ["operation"],
+    buckets=BYTES_BUCKETS))
+PAGE_BUILD_LATENCY = REGISTRY.register(Histogram(
+    "nicegui_page_build_duration_seconds", "Time to build a routed page for one client.", ["page"]))
+EVENT_LOOP_LAG = REGISTRY.register(Histogram(
+    "event_loop_lag_seconds", "Delay of the event loop in running a scheduled callback."))
+
+
+def resident_memory() -> Dict[Labels, float]:
+    """Resident set size of this process in bytes (Linux only)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return {(): int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")}
+    except (OSError, ValueError):
+        return {}
+
+
+REGISTRY.register(Gauge("process_resident_memory_bytes", "Resident memory size in bytes.", [], resident_memory))
+
+
+class EventLoopMonitor:
+    """Records how late the event loop runs a sleep that should take EVENT_LOOP_PROBE_INTERVAL."""
+
+    def __init__(self, interval: float = EVENT_LOOP_PROBE_INTERVAL) -> None:
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - start - self.interval))
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,104 @@
+import asyncio
+import heapq
+import json
+import os
+import secrets
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# State tokens expire 60 seconds after the authorization flow starts
+STATE_TTL = 60.0
+SWEEP_INTERVAL = 30.0
+
+
+class OAuthStateStore:
+    """Store of pending OAuth state tokens, expired by a background sweeper.
+
+    States are kept in process memory unless a shared backend (a store with
+    put_state/take_state/count_states/purge_states) is given, in which case a
+    callback can be served by any worker.
+    """
+
+    def __init__(self, ttl: float = STATE_TTL, sweep_interval: float = SWEEP_INTERVAL,
+                 persist_path: Optional[str] = None, backend: Optional[Any] = None) -> None:
+        self.ttl = ttl
+        self.backend = backend
+        self.sweep_interval = sweep_interval
+        self.persist_path = persist_path
+        self.states: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self.expiry_heap: List[Tuple[float, str]] = []
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        if self.backend is not None:
+            return self.backend.count_states()
+        return len(self.states)
+
+    def create(self, data: Dict[str, Any]) -> str:
+        """Store data under a new random state token and return the token."""
+        state = secrets.token_urlsafe(16)
+        if self.backend is not None:
+            self.backend.put_state(state, time.time() + self.ttl, data)
+        else:
+            self._add(state, time.time() + self.ttl, data)
+        return state
+
+    def _add(self, state: str, expires_at: float, data: Dict[str, Any]) -> None:
+        self.states[state] = (expires_at, data)
+        heapq.heappush(self.expiry_heap, (expires_at, state))
+
+    def consume(self, state: str) -> Optional[Dict[str, Any]]:
+        """Remove a state and return its data, or None if it is unknown or expired."""
+        if self.backend is not None:
+            return self.backend.take_state(state)
+        entry = self.states.pop(state, None)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        return data if expires_at >= time.time() else None
+
+    def sweep(self) -> int:
+        """Drop every expired state and return how many were removed."""
+        if self.backend is not None:
+            return self.backend.purge_states()
+        now = time.time()
+        removed = 0
+        while self.expiry_heap and self.expiry_heap[0][0] < now:
+            expires_at, state = heapq.heappop(self.expiry_heap)
+            entry = self.states.get(state)
+            # Skip heap entries whose state was already consumed
+            if entry is not None and entry[0] == expires_at:
+                del self.states[state]
+                removed += 1
+        # Consumed states leave stale heap entries behind; rebuild when they dominate
+        if len(self.expiry_heap) > 2 * len(self.states) + 64:
+            self.expiry_heap = [(expires_at, state) for state, (expires_at, _) in self.states.items()]
+            heapq.heapify(self.expiry_heap)
+        return removed
+
+    async def _run_sweeper(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
+
+    async def start(self) -> None:
+        """Reload persisted states and start the background sweeper."""
+        if self.backend is None and self.persist_path and os.path.exists(self.persist_path):
+            with open(self.persist_path) as f:
+                for state, (expires_at, data) in json.load(f).items():
+                    self._add(state, expires_at, data)
+            os.remove(self.persist_path)
+            self.sweep()
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._run_sweeper())
+
+    async def stop(self) -> None:
+        """Stop the sweeper and persist pending states if configured."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        if self.backend is None and self.persist_path:
+            self.sweep()
+            if self.states:
+                with open(self.persist_path, "w") as f:
+                    json.dump(self.states, f)
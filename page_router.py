@@ -1,7 +1,11 @@
-from typing import Callable, Dict, Union
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Union
 
 from nicegui import background_tasks, helpers, ui
 
+from metrics import PAGE_BUILD_LATENCY
+
 #https://github.com/zauberzeug/nicegui/blob/main/examples/single_page_app/router_frame.js
 class RouterFrame(ui.element, component='page_frame.js'):
     pass
@@ -9,37 +13,99 @@ class RouterFrame(ui.element, component='page_frame.js'):
 
 class Router:
 
-    def __init__(self) -> None:
+    def __init__(self, keep_alive: int = 0) -> None:
         self.routes: Dict[str, Callable] = {}
+        self.paths: Dict[Callable, str] = {}  # reverse route index, maintained by add()
         self.content: ui.element = None
+        self.current: Optional[str] = None
+        self.leave_handlers: Dict[str, List[Callable]] = {}
+        # Number of built pages kept alive in hidden containers (0 rebuilds on every navigation)
+        self.keep_alive = keep_alive
+        self.pages: "OrderedDict[str, ui.element]" = OrderedDict()
 
     def add(self, path: str):
         def decorator(func: Callable):
             self.routes[path] = func
+            self.paths[func] = path
             return func
         return decorator
 
+    def on_leave(self, handler: Callable) -> None:
+        """Register a handler that runs once when the current page is left (or evicted when kept alive)."""
+        self.leave_handlers.setdefault(self.current, []).append(handler)
+
+    def _leave(self, path: Optional[str]) -> None:
+        for handler in self.leave_handlers.pop(path, []):
+            handler()
+
+    def _push_history(self, path: str) -> None:
+        with self.content:
+            ui.run_javascript(f'''
+                if (window.location.pathname !== "{path}") {{
+                    history.pushState({{page: "{path}"}}, "", "{path}");
+                }}
+            ''')
+
     def open(self, target: Union[Callable, str]) -> None:
         if isinstance(target, str):
             path = target
             builder = self.routes[target]
         else:
-            path = {v: k for k, v in self.routes.items()}[target]
+            path = self.paths[target]
             builder = target
 
-        async def build() -> None:
+        if self.keep_alive and path in self.pages:
+            # Already built: just swap the visible container
+            if self.current in self.pages:
+                self.pages[self.current].set_visibility(False)
+            self.current = path
+            self.pages.move_to_end(path)
+            self.pages[path].set_visibility(True)
+            self._push_history(path)
+            return
+
+        if self.keep_alive:
+            if self.current in self.pages:
+                self.pages[self.current].set_visibility(False)
             with self.content:
-                ui.run_javascript(f'''
-                    if (window.location.pathname !== "{path}") {{
-                        history.pushState({{page: "{path}"}}, "", "{path}");
-                    }}
-                ''')
+                container = ui.element('div').classes('w-full')
+            self.pages[path] = container
+            while len(self.pages) > self.keep_alive:
+                self._evict(next(iter(self.pages)))
+        else:
+            self._leave(self.current)
+            self.content.clear()
+            container = self.content
+        self.current = path
+
+        async def build() -> None:
+            start = time.perf_counter()
+            self._push_history(path)
+            with container:
                 result = builder()
                 if helpers.is_coroutine_function(builder):
                     await result
-        self.content.clear()
+            PAGE_BUILD_LATENCY.observe(time.perf_counter() - start, path)
         background_tasks.create(build())
 
+    def _evict(self, path: str) -> None:
+        self._leave(path)
+        self.pages.pop(path).delete()
+
+    def invalidate(self, target: Union[Callable, str, None] = None) -> None:
+        """Drop kept-alive pages (all of them by default); the visible page is rebuilt."""
+        if target is None:
+            paths = list(self.pages)
+        else:
+            paths = [target if isinstance(target, str) else self.paths[target]]
+        current = self.current
+        for path in paths:
+            if path in self.pages:
+                self._evict(path)
+        if current in paths:
+            self.current = None
+            self.open(current)
+
     def frame(self) -> ui.element:
         self.content = RouterFrame().on('open', lambda e: self.open(e.args))
-        return self.content
\ No newline at end of file
+        return self.content
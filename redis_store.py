@@ -0,0 +1,602 @@
+import asyncio
+import json
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from redis.exceptions import WatchError
+
+from metrics import STORAGE_FLUSH_LATENCY
+from grid_model import grid_rows, page_rows, resolve_relative_fields
+from token_store import GRID_FIELDS, BULK_BATCH_SIZE, CHANGE_POLL_INTERVAL, ChangeListener
+
+KEY_PREFIX = "clio:"
+
+GATEWAY_TYPES = {"id": int, "name": str, "client_id": str, "client_secret": str, "region": str}
+TOKEN_TYPES = {"id": int, "gateway_id": int, "api_gateway": str, "access_token": str, "created_at": float,
+               "refresh_token": str, "expires_at": float, "status": str, "checked_at": float, "region": str}
+
+# Columns that imports deduplicate on, each indexed by a sorted set of value -> number of rows holding it
+VALUE_INDEXES = {"api_gateways": "client_id", "access_tokens": "access_token"}
+
+# In-process fake shared by every store opened with a "fakeredis://" URL
+_fake_server = None
+
+
+def connect(url: str):
+    """Open a Redis client; "fakeredis://" uses an in-process fake (requires the fakeredis package)."""
+    global _fake_server
+    if url.startswith("fakeredis://"):
+        import fakeredis
+        if _fake_server is None:
+            _fake_server = fakeredis.FakeServer()
+        return fakeredis.FakeRedis(server=_fake_server, decode_responses=True)
+    import redis
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+def _decode(mapping: Dict[str, str], types: Dict[str, Callable]) -> Optional[Dict[str, Any]]:
+    if not mapping:
+        return None
+    return {field: types[field](mapping[field]) if field in mapping else None for field in types}
+
+
+def _encode(row: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """Split a row into fields to set and fields to delete (Redis hashes cannot hold None)."""
+    return ({field: value for field, value in row.items() if value is not None},
+            [field for field, value in row.items() if value is None])
+
+
+def _score_range(model: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """ZRANGEBYSCORE bounds equivalent to a single number filter, or None if it has no equivalent."""
+    if model.get("filterType") != "number" or "conditions" in model or model.get("filter") is None:
+        return None
+    value = repr(float(model["filter"]))
+    return {
+        "equals": (value, value),
+        "lessThan": ("-inf", f"({value}"), "lessThanOrEqual": ("-inf", value),
+        "greaterThan": (f"({value}", "+inf"), "greaterThanOrEqual": (value, "+inf"),
+    }.get(model.get("type"))
+
+
+class RedisTokenStore:
+    """Redis-backed store with the same interface as TokenStore, for multi-worker deployments.
+
+    Rows are hashes indexed by sorted sets; OAuth states are keys with a TTL
+    and changes are broadcast to other workers over pub/sub.
+    """
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = KEY_PREFIX) -> None:
+        self.redis = connect(url)
+        self.prefix = prefix
+        self.channel = f"{prefix}changes"
+        self.listeners: List[ChangeListener] = []
+        self.origin = uuid.uuid4().hex
+        # True while changes made by other workers are being delivered to the listeners
+        self.replaying = False
+        self.pubsub = self.redis.pubsub()
+        self.pubsub.subscribe(self.channel)
+        self._watcher: Optional[asyncio.Task] = None
+        self._build_indexes()
+
+    def _key(self, *parts: Any) -> str:
+        return self.prefix + ":".join(str(part) for part in parts)
+
+    def _count_value(self, pipe: Any, table: str, value: Optional[str], delta: int) -> None:
+        """Queue a change of how many rows of `table` hold `value` in its deduplicated column."""
+        if value is None:
+            return
+        key = self._key("values", table)
+        pipe.zincrby(key, delta, value)
+        if delta < 0:
+            pipe.zremrangebyscore(key, "-inf", 0)
+
+    def _build_indexes(self) -> None:
+        """Build the value and no-expiry indexes for data stored before they existed (once per database)."""
+        if not self.redis.set(self._key("indexes_built"), 1, nx=True):
+            return
+        for table, field in VALUE_INDEXES.items():
+            counts: Dict[str, int] = {}
+            for row in self.iter_rows(table):
+                counts[row[field]] = counts.get(row[field], 0) + 1
+            if counts:
+                self.redis.zadd(self._key("values", table), counts)
+        without_expiry = {token["id"]: token["id"] for token in self.iter_rows("access_tokens") if token["expires_at"] is None}
+        if without_expiry:
+            self.redis.zadd(self._key("tokens_without_expiry"), without_expiry)
+
+    def close(self) -> None:
+        self.pubsub.close()
+        self.redis.close()
+
+    def add_listener(self, listener: ChangeListener) -> None:
+        """Register a callback for committed inserts ("added"), updates ("updated") and deletes ("removed")."""
+        self.listeners.append(listener)
+
+    def _notify(self, table: str, action: str, rows: List[Dict[str, Any]]) -> None:
+        if rows:
+            for listener in self.listeners:
+                listener(table, action, rows)
+
+    @contextmanager
+    def _write(self, operation: str, watch: Sequence[str] = ()) -> Iterator[Tuple[Any, List[Tuple[str, str, List[Dict[str, Any]]]]]]:
+        """Queue commands on a MULTI/EXEC pipeline, publish the queued changes with it, then notify listeners.
+
+        With `watch`, the keys are WATCHed first: read them, then call pipe.multi()
+        before queueing (or leave without it to write nothing). EXEC raises
+        WatchError if another client changed a watched key in between.
+        """
+        start = time.perf_counter()
+        pipe = self.redis.pipeline(transaction=True)
+        changes: List[Tuple[str, str, List[Dict[str, Any]]]] = []
+        try:
+            if watch:
+                pipe.watch(*watch)
+            yield pipe, changes
+            if watch and not pipe.explicit_transaction:
+                return
+            changes = [change for change in changes if change[2]]
+            if any(table == "api_gateways" for table, _, _ in changes):
+                # Lets read models notice gateway writes they were not notified of (see gateways_version)
+                pipe.incr(self._key("gateways_version"))
+            for table, action, rows in changes:
+                pipe.publish(self.channel, json.dumps({"origin": self.origin, "table": table, "action": action, "rows": rows}))
+            pipe.execute()
+        finally:
+            pipe.reset()
+        STORAGE_FLUSH_LATENCY.observe(time.perf_counter() - start, operation)
+        for change in changes:
+            self._notify(*change)
+
+    @staticmethod
+    def _retry(attempt: Callable[[], Any]) -> Any:
+        """Run a WATCH-guarded write until none of its watched keys changed under it."""
+        while True:
+            try:
+                return attempt()
+            except WatchError:
+                continue
+
+    def _fetch(self, keys: Iterable[str], types: Dict[str, Callable]) -> List[Dict[str, Any]]:
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
+        return [row for row in (_decode(mapping, types) for mapping in pipe.execute()) if row is not None]
+
+    # API gateways
+
+    def gateways(self) -> List[Dict[str, Any]]:
+        """Return every API gateway ordered by ID."""
+        ids = self.redis.zrange(self._key("gateways"), 0, -1)
+        return self._fetch([self._key("gateway", gateway_id) for gateway_id in ids], GATEWAY_TYPES)
+
+    def get_gateway(self, gateway_id: int) -> Optional[Dict[str, Any]]:
+        return _decode(self.redis.hgetall(self._key("gateway", gateway_id)), GATEWAY_TYPES)
+
+    def add_gateway(self, name: str, client_id: str, client_secret: str, region: Optional[str] = None,
+                    gateway_id: Optional[int] = None) -> Dict[str, Any]:
+        """Insert a gateway and return it with its new primary key."""
+        if gateway_id is None:
+            gateway_id = self.redis.incr(self._key("gateway_seq"))
+        gateway = {"id": gateway_id, "name": name, "client_id": client_id, "client_secret": client_secret, "region": region}
+        with self._write("add_gateway") as (pipe, changes):
+            pipe.hset(self._key("gateway", gateway_id), mapping=_encode(gateway)[0])
+            pipe.zadd(self._key("gateways"), {gateway_id: gateway_id})
+            self._count_value(pipe, "api_gateways", client_id, 1)
+            changes.append(("api_gateways", "added", [gateway]))
+        return gateway
+
+    def update_gateway(self, row: Dict[str, Any]) -> None:
+        self.update_gateways([row])
+
+    def update_gateways(self, rows: List[Dict[str, Any]]) -> None:
+        """Write several edited gateways in a single transaction; gateways deleted meanwhile are skipped."""
+        keys = [self._key("gateway", row["id"]) for row in rows]
+        self._retry(lambda: self._update_gateways(rows, keys))
+
+    def _update_gateways(self, rows: List[Dict[str, Any]], keys: List[str]) -> None:
+        with self._write("update_gateways", watch=keys) as (pipe, changes):
+            stored = {gateway["id"]: gateway for gateway in self._fetch(keys, GATEWAY_TYPES)}
+            existing = [row for row in rows if row["id"] in stored]
+            pipe.multi()
+            for row in existing:
+                fields, cleared = _encode({"name": row["name"], "client_id": row["client_id"],
+                                           "client_secret": row["client_secret"], "region": row.get("region") or None})
+                pipe.hset(self._key("gateway", row["id"]), mapping=fields)
+                if cleared:
+                    pipe.hdel(self._key("gateway", row["id"]), *cleared)
+                if row["client_id"] != stored[row["id"]]["client_id"]:
+                    self._count_value(pipe, "api_gateways", row["client_id"], 1)
+                    self._count_value(pipe, "api_gateways", stored[row["id"]]["client_id"], -1)
+            changes.append(("api_gateways", "updated", existing))
+
+    def delete_gateway(self, gateway_id: int) -> None:
+        gateway = self.get_gateway(gateway_id)
+        with self._write("delete_gateway") as (pipe, changes):
+            pipe.delete(self._key("gateway", gateway_id))
+            pipe.zrem(self._key("gateways"), gateway_id)
+            if gateway:
+                self._count_value(pipe, "api_gateways", gateway["client_id"], -1)
+            changes.append(("api_gateways", "removed", [gateway] if gateway else []))
+
+    # Access tokens
+
+    def tokens(self, api_gateway: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return stored access tokens, optionally only those of one gateway."""
+        index = self._key("tokens") if api_gateway is None else self._key("gateway_tokens", api_gateway)
+        return self._fetch([self._key("token", token_id) for token_id in self.redis.zrange(index, 0, -1)], TOKEN_TYPES)
+
+    def token_gateways(self) -> List[str]:
+        """Return the distinct gateway names that own at least one token."""
+        return sorted(self.redis.smembers(self._key("token_gateways")))
+
+    def current_token(self, api_gateway: str) -> Optional[Dict[str, Any]]:
+        """Return the newest unexpired token of a gateway that has not failed a health check."""
+        now = time.time()
+        index = self._key("gateway_tokens", api_gateway)
+        start = 0
+        while True:
+            ids = self.redis.zrevrange(index, start, start + 9)
+            if not ids:
+                return None
+            for token in self._fetch([self._key("token", token_id) for token_id in ids], TOKEN_TYPES):
+                if (token["expires_at"] is None or token["expires_at"] > now) and token["status"] != "invalid":
+                    return token
+            start += len(ids)
+
+    def token_counts(self) -> Dict[str, int]:
+        """Return the number of stored tokens per gateway name."""
+        names = self.token_gateways()
+        pipe = self.redis.pipeline(transaction=False)
+        for name in names:
+            pipe.zcard(self._key("gateway_tokens", name))
+        return dict(zip(names, pipe.execute()))
+
+    def token_count(self) -> int:
+        return self.redis.zcard(self._key("tokens"))
+
+    def get_token(self, token_id: int) -> Optional[Dict[str, Any]]:
+        return _decode(self.redis.hgetall(self._key("token", token_id)), TOKEN_TYPES)
+
+    def refreshable_tokens(self) -> List[Dict[str, Any]]:
+        """Return tokens that have a refresh token and a known expiry."""
+        ids = self.redis.zrange(self._key("tokens_by_expiry"), 0, -1)
+        return [token for token in self._fetch([self._key("token", token_id) for token_id in ids], TOKEN_TYPES)
+                if token["refresh_token"]]
+
+    def dead_tokens(self, now: float, max_age: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Return tokens expired by `now` and, with max_age, tokens issued more than max_age seconds ago.
+
+        Expired tokens that have a refresh token are left to the refresh scheduler.
+        """
+        expired = set(self.redis.zrangebyscore(self._key("tokens_by_expiry"), "-inf", now))
+        over_age = set()
+        if max_age is not None:
+            # Per-gateway indexes are scored by creation time
+            for name in self.token_gateways():
+                over_age.update(self.redis.zrangebyscore(self._key("gateway_tokens", name), "-inf", f"({now - max_age}"))
+        tokens = self._fetch([self._key("token", token_id) for token_id in sorted(expired | over_age, key=int)], TOKEN_TYPES)
+        return [token for token in tokens if str(token["id"]) in over_age or not token["refresh_token"]]
+
+    def add_token(self, api_gateway: str, access_token: str, gateway_id: Optional[int] = None,
+                  refresh_token: Optional[str] = None, expires_at: Optional[float] = None,
+                  region: Optional[str] = None) -> Dict[str, Any]:
+        """Insert a token in its own transaction and return the stored row."""
+        return self.add_tokens([{"api_gateway": api_gateway, "access_token": access_token, "gateway_id": gateway_id,
+                                 "refresh_token": refresh_token, "expires_at": expires_at, "region": region}],
+                               "add_token")[0]
+
+    def add_tokens(self, rows: List[Dict[str, Any]], operation: str = "add_tokens") -> List[Dict[str, Any]]:
+        """Insert several tokens in a single transaction and return the stored rows."""
+        if not rows:
+            return []
+        last_id = self.redis.incrby(self._key("token_seq"), len(rows))
+        now = time.time()
+        added = []
+        with self._write(operation) as (pipe, changes):
+            for token_id, row in enumerate(rows, last_id - len(rows) + 1):
+                token = {"id": token_id, "gateway_id": row.get("gateway_id"), "api_gateway": row["api_gateway"],
+                         "access_token": row["access_token"], "created_at": row.get("created_at") or now,
+                         "refresh_token": row.get("refresh_token"), "expires_at": row.get("expires_at"),
+                         "status": None, "checked_at": None, "region": row.get("region")}
+                pipe.hset(self._key("token", token_id), mapping=_encode(token)[0])
+                pipe.zadd(self._key("tokens"), {token_id: token_id})
+                pipe.zadd(self._key("gateway_tokens", token["api_gateway"]), {token_id: token["created_at"]})
+                pipe.sadd(self._key("token_gateways"), token["api_gateway"])
+                if token["expires_at"] is not None:
+                    pipe.zadd(self._key("tokens_by_expiry"), {token_id: token["expires_at"]})
+                else:
+                    pipe.zadd(self._key("tokens_without_expiry"), {token_id: token_id})
+                self._count_value(pipe, "access_tokens", token["access_token"], 1)
+                added.append(token)
+            changes.append(("access_tokens", "added", added))
+        return added
+
+    def replace_token(self, token_id: int, access_token: str, refresh_token: Optional[str],
+                      expires_at: Optional[float]) -> Optional[Dict[str, Any]]:
+        """Atomically swap in a rotated token; returns None if the token was deleted meanwhile."""
+        return self._retry(lambda: self._replace_token(token_id, access_token, refresh_token, expires_at))
+
+    def _replace_token(self, token_id: int, access_token: str, refresh_token: Optional[str],
+                       expires_at: Optional[float]) -> Optional[Dict[str, Any]]:
+        key = self._key("token", token_id)
+        # Watching the hash keeps a concurrent delete from being undone by the writes below
+        with self._write("replace_token", watch=[key]) as (pipe, changes):
+            token = _decode(pipe.hgetall(key), TOKEN_TYPES)
+            if token is None:
+                return None
+            previous_access_token = token["access_token"]
+            # A rotated token has not been health-checked yet
+            token.update(access_token=access_token, refresh_token=refresh_token, expires_at=expires_at,
+                         status=None, checked_at=None)
+            values, cleared = _encode({field: token[field] for field in
+                                       ("access_token", "refresh_token", "expires_at", "status", "checked_at")})
+            pipe.multi()
+            pipe.hset(key, mapping=values)
+            if cleared:
+                pipe.hdel(key, *cleared)
+            if expires_at is None:
+                pipe.zrem(self._key("tokens_by_expiry"), token_id)
+                pipe.zadd(self._key("tokens_without_expiry"), {token_id: token_id})
+            else:
+                pipe.zadd(self._key("tokens_by_expiry"), {token_id: expires_at})
+                pipe.zrem(self._key("tokens_without_expiry"), token_id)
+            self._count_value(pipe, "access_tokens", access_token, 1)
+            self._count_value(pipe, "access_tokens", previous_access_token, -1)
+            changes.append(("access_tokens", "updated", [token]))
+        return token
+
+    def record_health(self, statuses: Dict[int, str], checked_at: float) -> None:
+        """Store health-check results ({id: status}) in a single transaction; deleted tokens are skipped."""
+        keys = [self._key("token", token_id) for token_id in statuses]
+        self._retry(lambda: self._record_health(statuses, checked_at, keys))
+
+    def _record_health(self, statuses: Dict[int, str], checked_at: float, keys: List[str]) -> None:
+        with self._write("record_health", watch=keys) as (pipe, changes):
+            updated = self._fetch(keys, TOKEN_TYPES)
+            pipe.multi()
+            for token in updated:
+                token.update(status=statuses[token["id"]], checked_at=checked_at)
+                pipe.hset(self._key("token", token["id"]), mapping={"status": token["status"], "checked_at": checked_at})
+            changes.append(("access_tokens", "updated", updated))
+
+    def delete_tokens(self, token_ids: Iterable[int]) -> None:
+        """Delete tokens by primary key in a single transaction."""
+        self._retry(lambda: self._delete_tokens({token_id: None for token_id in token_ids}))
+
+    def delete_unchanged_tokens(self, tokens: Dict[int, str]) -> List[int]:
+        """Delete tokens ({id: access_token}) only if they still hold that access token; returns the deleted ids.
+
+        A token rotated since it was read keeps its hash, so a slow revoke never deletes its successor.
+        """
+        return self._retry(lambda: self._delete_tokens(tokens))
+
+    def _delete_tokens(self, tokens: Dict[int, Optional[str]]) -> List[int]:
+        """Delete the given tokens under WATCH, skipping those whose access token differs from a given value."""
+        keys = [self._key("token", token_id) for token_id in tokens]
+        with self._write("delete_tokens", watch=keys) as (pipe, changes):
+            removed = [token for token in self._fetch(keys, TOKEN_TYPES)
+                       if tokens.get(token["id"]) in (None, token["access_token"])]
+            pipe.multi()
+            for token in removed:
+                pipe.delete(self._key("token", token["id"]))
+                pipe.zrem(self._key("tokens"), token["id"])
+                pipe.zrem(self._key("tokens_by_expiry"), token["id"])
+                pipe.zrem(self._key("tokens_without_expiry"), token["id"])
+                pipe.zrem(self._key("gateway_tokens", token["api_gateway"]), token["id"])
+                self._count_value(pipe, "access_tokens", token["access_token"], -1)
+            changes.append(("access_tokens", "removed", removed))
+        for name in {token["api_gateway"] for token in removed}:
+            if not self.redis.zcard(self._key("gateway_tokens", name)):
+                self.redis.srem(self._key("token_gateways"), name)
+        return [token["id"] for token in removed]
+
+    # Bulk import and export
+
+    def iter_rows(self, table: str, batch_size: int = BULK_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+        """Yield every row of a table in ID order, reading one batch at a time."""
+        if table not in GRID_FIELDS:
+            raise ValueError(f"Unknown table: {table}")
+        index, prefix, types = ((self._key("gateways"), "gateway", GATEWAY_TYPES) if table == "api_gateways"
+                                else (self._key("tokens"), "token", TOKEN_TYPES))
+        start = 0
+        while True:
+            ids = self.redis.zrange(index, start, start + batch_size - 1)
+            yield from self._fetch([self._key(prefix, row_id) for row_id in ids], types)
+            if len(ids) < batch_size:
+                return
+            start += batch_size
+
+    def existing_values(self, table: str, field: str, values: Iterable[str]) -> Set[str]:
+        """Return which of the given values are already stored in a column (one ZMSCORE on its value index)."""
+        if VALUE_INDEXES.get(table) != field:
+            raise ValueError(f"Column is not indexed by value: {table}.{field}")
+        values = list(dict.fromkeys(values))
+        if not values:
+            return set()
+        counts = self.redis.zmscore(self._key("values", table), values)
+        return {value for value, count in zip(values, counts) if count}
+
+    def add_gateways(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert several gateways in a single transaction and return them with their primary keys."""
+        if not rows:
+            return []
+        last_id = self.redis.incrby(self._key("gateway_seq"), len(rows))
+        added = [{"id": gateway_id, "name": row["name"], "client_id": row["client_id"], "client_secret": row["client_secret"],
+                  "region": row.get("region")} for gateway_id, row in enumerate(rows, last_id - len(rows) + 1)]
+        with self._write("add_gateways") as (pipe, changes):
+            for gateway in added:
+                pipe.hset(self._key("gateway", gateway["id"]), mapping=_encode(gateway)[0])
+                pipe.zadd(self._key("gateways"), {gateway["id"]: gateway["id"]})
+                self._count_value(pipe, "api_gateways", gateway["client_id"], 1)
+            changes.append(("api_gateways", "added", added))
+        return added
+
+    # OAuth states
+
+    def put_state(self, state: str, expires_at: float, data: Dict[str, Any]) -> None:
+        ttl = max(1, int((expires_at - time.time()) * 1000))
+        with self._write("put_state") as (pipe, _):
+            pipe.set(self._key("state", state), json.dumps(data), px=ttl)
+            pipe.zadd(self._key("states"), {state: expires_at})
+
+    def take_state(self, state: str) -> Optional[Dict[str, Any]]:
+        """Delete a state and return its data if it has not expired (validate-and-consume)."""
+        with self._write("take_state") as (pipe, _):
+            pipe.getdel(self._key("state", state))
+            pipe.zrem(self._key("states"), state)
+            # Run the transaction here to read the GETDEL result
+            data, _ = pipe.execute()
+        return json.loads(data) if data else None
+
+    def count_states(self) -> int:
+        return self.redis.zcount(self._key("states"), time.time(), "+inf")
+
+    def purge_states(self) -> int:
+        """Drop expired entries from the state index (the state keys expire on their own)."""
+        return self.redis.zremrangebyscore(self._key("states"), "-inf", time.time())
+
+    # Cross-worker change notification
+
+    def gateways_version(self) -> int:
+        """Return a counter that every worker's gateway writes move."""
+        return int(self.redis.get(self._key("gateways_version")) or 0)
+
+    def poll_changes(self) -> int:
+        """Deliver changes published by other workers to the local listeners; returns how many were delivered."""
+        delivered = 0
+        while True:
+            message = self.pubsub.get_message(timeout=0)
+            if message is None:
+                return delivered
+            if message["type"] != "message":
+                continue
+            change = json.loads(message["data"])
+            if change["origin"] != self.origin:
+                self.replaying = True
+                try:
+                    self._notify(change["table"], change["action"], change["rows"])
+                finally:
+                    self.replaying = False
+                delivered += 1
+
+    async def watch_changes(self, interval: float = CHANGE_POLL_INTERVAL) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.poll_changes()
+
+    async def start(self) -> None:
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self.watch_changes())
+
+    async def stop(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    # Paginated grids
+
+    def page(self, table: str, start: int, end: int, sort_model: Optional[List[Dict[str, str]]] = None,
+             filter_model: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Return one window of rows for an AG Grid infinite row model.
+
+        Token windows ordered by id or expiry, filtered on at most that column,
+        are read straight from the sorted-set indexes; anything else is sorted
+        and filtered in Python.
+        """
+        sort_model, filter_model = resolve_relative_fields(sort_model, filter_model, time.time())
+        if table == "access_tokens":
+            indexed = self._token_window(start, end, sort_model, filter_model)
+            if indexed is not None:
+                ids, last_row = indexed
+                window = self._fetch([self._key("token", token_id) for token_id in ids], TOKEN_TYPES)
+                return grid_rows(window, GRID_FIELDS[table]), last_row
+        rows = self.gateways() if table == "api_gateways" else self.tokens()
+        window, last_row = page_rows(rows, GRID_FIELDS[table], start, end, sort_model, filter_model)
+        return grid_rows(window, GRID_FIELDS[table]), last_row
+
+    def _token_window(self, start: int, end: int, sort_model: Optional[List[Dict[str, str]]],
+                      filter_model: Optional[Dict[str, Any]]) -> Optional[Tuple[List[str], int]]:
+        """Token ids of one grid window read from the id or expiry index, or None if the window needs a scan."""
+        sorts = [sort for sort in sort_model or [] if sort.get("colId") in GRID_FIELDS["access_tokens"]]
+        filters = {field: model for field, model in (filter_model or {}).items() if field in GRID_FIELDS["access_tokens"]}
+        if len(sorts) > 1 or len(filters) > 1:
+            return None
+        field = sorts[0]["colId"] if sorts else "id"
+        descending = bool(sorts) and sorts[0].get("sort") == "desc"
+        if field not in ("id", "expires_at"):
+            return None
+        low, high = "-inf", "+inf"
+        if filters:
+            filter_field, model = next(iter(filters.items()))
+            bounds = _score_range(model)
+            if filter_field != field or bounds is None:
+                return None
+            low, high = bounds
+
+        # (index, descending, low, high) read one after the other
+        if field == "id":
+            segments = [(self._key("tokens"), descending, low, high)]
+        else:
+            segments = [(self._key("tokens_by_expiry"), descending, low, high)]
+            if not filters:
+                # Tokens without an expiry sort first ascending and last descending, by id either way
+                without_expiry = (self._key("tokens_without_expiry"), False, "-inf", "+inf")
+                segments = segments + [without_expiry] if descending else [without_expiry] + segments
+
+        start, end = max(0, start), max(0, end)
+        ids: List[str] = []
+        offset, total = start, 0
+        for key, reverse, low, high in segments:
+            count = self.redis.zcount(key, low, high)
+            total += count
+            if offset >= count:
+                offset -= count
+                continue
+            wanted = end - start - len(ids)
+            if wanted > 0:
+                ids += self._score_window(key, reverse, low, high, offset, wanted)
+            offset = 0
+        return ids, total if end >= total else -1
+
+    def _score_window(self, key: str, reverse: bool, low: str, high: str, offset: int, num: int) -> List[str]:
+        """Members of a sorted-set window ordered by score, then numerically by id like the SQL queries.
+
+        Redis orders members with equal scores as strings (and reverses them
+        descending), so the ties at both edges of the window are re-read whole
+        and placed by id.
+        """
+        if reverse:
+            window = self.redis.zrevrangebyscore(key, high, low, start=offset, num=num, withscores=True)
+        else:
+            window = self.redis.zrangebyscore(key, low, high, start=offset, num=num, withscores=True)
+        if not window:
+            return []
+        first, last = window[0][1], window[-1][1]
+        if reverse:
+            before = self.redis.zcount(key, f"({first!r}", high)
+            members = self.redis.zrangebyscore(key, repr(last), repr(first), withscores=True)
+        else:
+            before = self.redis.zcount(key, low, f"({first!r}")
+            members = self.redis.zrangebyscore(key, repr(first), repr(last), withscores=True)
+        members.sort(key=lambda member: (-member[1] if reverse else member[1], int(member[0])))
+        return [member for member, _ in members[offset - before:offset - before + num]]
+
+    # Migration
+
+    def import_legacy(self, gateway_data: Optional[Dict[str, Any]], token_list: Optional[List[Dict[str, Any]]]) -> bool:
+        """Copy the old app.storage.general gateways and tokens into an empty store."""
+        if self.redis.zcard(self._key("gateways")) or self.token_count():
+            return False
+        gateway_rows = (gateway_data or {}).get("rows", [])
+        for gateway_id, name, client_id, client_secret in (row[:4] for row in gateway_rows):
+            self.add_gateway(name, client_id, client_secret, gateway_id=gateway_id)
+        if gateway_rows:
+            self.redis.set(self._key("gateway_seq"), max(row[0] for row in gateway_rows))
+        for token in token_list or []:
+            self.add_token(token.get("api_gateway") or "", token["access_token"])
+        return bool(gateway_rows or token_list)
+
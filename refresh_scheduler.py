@@ -0,0 +1,151 @@
+import asyncio
+import heapq
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from clio_oauth import ClioOAuthClient
+from clio_regions import endpoints
+from journal import acting_as
+from token_store import TokenStore
+
+log = logging.getLogger(__name__)
+
+# Refresh tokens one day before they expire, spread over an extra hour of jitter
+REFRESH_MARGIN = 24 * 60 * 60
+REFRESH_JITTER = 60 * 60
+REFRESH_CONCURRENCY = 5
+
+# Delay before retrying a failed refresh
+RETRY_DELAY = 5 * 60
+
+
+class RefreshScheduler:
+    """Renews stored access tokens shortly before they expire.
+
+    Tokens are kept in a min-heap ordered by their refresh time; one loop
+    sleeps until the earliest is due and refreshes due tokens with bounded
+    concurrency.
+    """
+
+    def __init__(self, store: TokenStore, oauth_client: ClioOAuthClient, token_url: Optional[str] = None,
+                 margin: float = REFRESH_MARGIN, jitter: float = REFRESH_JITTER,
+                 concurrency: int = REFRESH_CONCURRENCY) -> None:
+        self.store = store
+        self.oauth_client = oauth_client
+        # None sends each refresh to the token endpoint of the token's own region
+        self.token_url = token_url
+        self.margin = margin
+        self.jitter = jitter
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.heap: List[Tuple[float, int]] = []
+        self.due: Dict[int, float] = {}
+        self.in_flight: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        store.add_listener(self._handle_change)
+
+    def _handle_change(self, table: str, action: str, rows: List[Dict[str, Any]]) -> None:
+        """Follow token writes, including those made by other workers sharing the store."""
+        if table != "access_tokens":
+            return
+        for row in rows:
+            if action == "removed":
+                self.unschedule(row["id"])
+            # Updates to scheduled tokens (e.g. health checks) keep their refresh time
+            elif action == "added" or row["id"] not in self.due:
+                self.schedule(row)
+
+    def schedule(self, token: Dict[str, Any], refresh_at: Optional[float] = None) -> None:
+        """Queue a token for refresh before its expiry (no-op without a refresh token)."""
+        if not token.get("refresh_token") or not token.get("expires_at"):
+            return
+        if refresh_at is None:
+            refresh_at = token["expires_at"] - self.margin - random.uniform(0, self.jitter)
+        self.due[token["id"]] = refresh_at
+        heapq.heappush(self.heap, (refresh_at, token["id"]))
+        self._wakeup.set()
+
+    def unschedule(self, token_id: int) -> None:
+        """Forget a token; its heap entry is skipped when it comes due."""
+        self.due.pop(token_id, None)
+
+    async def start(self) -> None:
+        for token in self.store.refreshable_tokens():
+            self.schedule(token)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in list(self.in_flight):
+            task.cancel()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            timeout = self.heap[0][0] - time.time() if self.heap else None
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            refresh_at, token_id = heapq.heappop(self.heap)
+            # Skip entries that were rescheduled or unscheduled since they were pushed
+            if self.due.get(token_id) != refresh_at:
+                continue
+            del self.due[token_id]
+            task = asyncio.create_task(self.refresh(token_id))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    async def refresh(self, token_id: int) -> Optional[Dict[str, Any]]:
+        """Refresh one token and atomically replace the stored entry."""
+        async with self.semaphore:
+            token = self.store.get_token(token_id)
+            if token is None or not token.get("refresh_token"):
+                return None
+            if token["expires_at"] and token["expires_at"] - self.margin > time.time() + self.jitter:
+                # Already refreshed by another worker
+                self.schedule(token)
+                return None
+            gateway = self.store.get_gateway(token["gateway_id"]) if token.get("gateway_id") else None
+            if gateway is None:
+                log.warning("Cannot refresh token %s: API gateway no longer exists", token_id)
+                return None
+
+            try:
+                response = await self.oauth_client.refresh(
+                    self.token_url or endpoints(token["region"]).token_url,
+                    gateway["client_id"], gateway["client_secret"], token["refresh_token"])
+            except httpx.HTTPError as e:
+                response = None
+                log.warning("Refreshing token %s failed: %s", token_id, e)
+
+            if response is None or response.status_code != 200:
+                if response is not None:
+                    log.warning("Refreshing token %s failed with status %s", token_id, response.status_code)
+                retry_at = time.time() + RETRY_DELAY
+                if retry_at < token["expires_at"]:
+                    self.schedule(token, refresh_at=retry_at)
+                return None
+
+            token_data = response.json()
+            expires_in = token_data.get("expires_in")
+            with acting_as("refresh_scheduler"):
+                refreshed = self.store.replace_token(
+                    token_id,
+                    token_data["access_token"],
+                    # Clio only returns a new refresh token when it rotates it
+                    token_data.get("refresh_token", token["refresh_token"]),
+                    time.time() + expires_in if expires_in else None,
+                )
+            if refreshed is not None:
+                self.schedule(refreshed)
+            return refreshed
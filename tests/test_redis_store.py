@@ -0,0 +1,110 @@
+import uuid
+
+import pytest
+
+pytest.importorskip("fakeredis")
+
+import redis_store
+from redis_store import RedisTokenStore
+from token_store import TokenStore
+
+NOW = 1_700_000_000.0
+
+# Same rows in both stores, so paging can be compared with the SQL queries
+TOKENS = [{"api_gateway": f"gw-{i % 3}", "access_token": f"token-{i}", "created_at": NOW - i * 60,
+           "expires_at": None if i % 4 == 0 else NOW + (i * 37 % 11) * 3600} for i in range(1, 25)]
+
+WINDOWS = [
+    (0, 10, None, None),
+    (5, 15, [{"colId": "id", "sort": "desc"}], None),
+    (0, 30, [{"colId": "expires_at", "sort": "asc"}], None),
+    (20, 30, [{"colId": "expires_at", "sort": "desc"}], None),
+    (0, 5, [{"colId": "expires_at", "sort": "asc"}],
+     {"expires_at": {"filterType": "number", "type": "greaterThan", "filter": NOW + 4 * 3600}}),
+    (0, 10, [{"colId": "api_gateway", "sort": "asc"}], {"api_gateway": {"filterType": "text", "type": "equals", "filter": "gw-1"}}),
+]
+
+
+def open_pair():
+    """Two stores on one fake Redis, like two workers."""
+    prefix = f"test-{uuid.uuid4().hex}:"
+    return RedisTokenStore("fakeredis://", prefix), RedisTokenStore("fakeredis://", prefix)
+
+
+@pytest.fixture
+def stores():
+    return open_pair()
+
+
+@pytest.fixture
+def store(stores):
+    return stores[0]
+
+
+def test_replace_retries_when_the_token_is_deleted_under_watch(stores, monkeypatch):
+    store, other = stores
+    token = store.add_token("gw", "old", refresh_token="refresh", expires_at=NOW)
+    encode = redis_store._encode
+
+    def delete_then_encode(row):
+        # Another worker deletes the token between the WATCHed read and EXEC
+        monkeypatch.setattr(redis_store, "_encode", encode)
+        other.delete_tokens([token["id"]])
+        return encode(row)
+
+    monkeypatch.setattr(redis_store, "_encode", delete_then_encode)
+    assert store.replace_token(token["id"], "new", None, NOW + 3600) is None
+    assert store.tokens() == []
+    assert store.existing_values("access_tokens", "access_token", ["old", "new"]) == set()
+
+
+def test_conditional_delete_keeps_a_token_rotated_under_watch(stores):
+    store, other = stores
+    token = store.add_token("gw", "old", expires_at=NOW)
+    fetch = store._fetch
+
+    def fetch_then_rotate(keys, types):
+        rows = fetch(keys, types)
+        store._fetch = fetch
+        other.replace_token(token["id"], "rotated", None, NOW + 3600)
+        return rows
+
+    store._fetch = fetch_then_rotate
+    assert store.delete_unchanged_tokens({token["id"]: "old"}) == []
+    assert [row["access_token"] for row in store.tokens()] == ["rotated"]
+
+
+@pytest.mark.parametrize("window", WINDOWS)
+def test_page_matches_sqlite(store, tmp_path, window, monkeypatch):
+    sqlite = TokenStore(str(tmp_path / "tokens.db"))
+    sqlite.add_tokens(TOKENS)
+    store.add_tokens(TOKENS)
+    monkeypatch.setattr("time.time", lambda: NOW)
+
+    assert store.page("access_tokens", *window) == sqlite.page("access_tokens", *window)
+    # The sorted-set fast path and the in-memory scan agree
+    monkeypatch.setattr(store, "_token_window", lambda *args: None)
+    assert store.page("access_tokens", *window) == sqlite.page("access_tokens", *window)
+    sqlite.close()
+
+
+def test_changes_are_replayed_from_other_workers(stores):
+    store, other = stores
+    seen = []
+    store.add_listener(lambda table, action, rows: seen.append((table, action, [row["name"] for row in rows], store.replaying)))
+
+    store.add_gateway("local", "c1", "s1")
+    assert store.poll_changes() == 0
+    other.add_gateway("remote", "c2", "s2")
+    assert store.poll_changes() == 1
+    assert seen == [("api_gateways", "added", ["local"], False), ("api_gateways", "added", ["remote"], True)]
+    assert not store.replaying
+
+
+def test_gateways_version_moves_with_gateway_writes_only(stores):
+    store, other = stores
+    version = store.gateways_version()
+    other.add_token("gw", "token")
+    assert store.gateways_version() == version
+    other.add_gateway("gw", "c1", "s1")
+    assert store.gateways_version() != version
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from token_cache import TokenCache
+from token_store import TokenStore
+
+
+class CountingStore(TokenStore):
+    """TokenStore that counts current_token lookups."""
+
+    lookups = 0
+
+    def current_token(self, api_gateway):
+        self.lookups += 1
+        return super().current_token(api_gateway)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CountingStore(str(tmp_path / "tokens.db"))
+    yield store
+    store.close()
+
+
+def test_hit_is_served_from_memory_until_the_token_changes(store):
+    cache = TokenCache(store)
+    token = store.add_token("gw", "first", expires_at=time.time() + 3600)
+
+    body, etag = cache.get("gw")
+    assert b'"first"' in body
+    assert cache.get("gw") == (body, etag)
+    assert store.lookups == 1
+
+    store.replace_token(token["id"], "second", None, time.time() + 3600)
+    body, new_etag = cache.get("gw")
+    assert b'"second"' in body and new_etag != etag
+    assert store.lookups == 2
+
+
+def test_miss_is_not_cached(store):
+    cache = TokenCache(store)
+    for name in ("unknown-1", "unknown-2", "unknown-1"):
+        assert cache.get(name) is None
+    assert cache.entries == {}
+    assert store.lookups == 3
+
+    store.add_token("unknown-1", "issued", expires_at=time.time() + 3600)
+    assert cache.get("unknown-1") is not None
+
+
+def test_expired_entry_is_dropped(store):
+    cache = TokenCache(store)
+    store.add_token("gw", "short", expires_at=time.time() + 0.05)
+    assert cache.get("gw") is not None
+    time.sleep(0.06)
+    assert cache.get("gw") is None
+    assert "gw" not in cache.entries
@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+from token_store import TokenStore
+
+NOW = 1_700_000_000.0
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "tokens.db")
+
+
+@pytest.fixture
+def stores(path):
+    """Two shared stores on one database file, like two workers."""
+    stores = TokenStore(path, shared=True), TokenStore(path, shared=True)
+    yield stores
+    for store in stores:
+        store.close()
+
+
+def test_change_log_replays_other_workers_changes(stores):
+    store, other = stores
+    seen = []
+    store.add_listener(lambda table, action, rows: seen.append((table, action, [row["id"] for row in rows], store.replaying)))
+
+    own = store.add_gateway("local", "c1", "s1")
+    assert store.poll_changes() == 0
+    remote = other.add_gateway("remote", "c2", "s2")
+    other.update_gateway({**remote, "name": "renamed"})
+    other.delete_gateway(remote["id"])
+    assert store.poll_changes() == 3
+    assert seen == [("api_gateways", "added", [own["id"]], False),
+                    ("api_gateways", "added", [remote["id"]], True),
+                    ("api_gateways", "updated", [remote["id"]], True),
+                    ("api_gateways", "removed", [remote["id"]], True)]
+    assert store.poll_changes() == 0 and not store.replaying
+
+
+def test_poll_skips_the_log_until_another_connection_commits(stores):
+    store, other = stores
+    assert store.poll_changes() == 0
+    version = store.gateways_version()
+    store.add_gateway("local", "c1", "s1")
+    assert store.gateways_version() == version
+    other.add_gateway("remote", "c2", "s2")
+    assert store.gateways_version() != version
+    assert store.poll_changes() == 1
+
+
+def test_local_store_writes_no_change_log(path):
+    store = TokenStore(path)
+    store.add_gateway("local", "c1", "s1")
+    assert store._query("SELECT COUNT(*) AS count FROM change_log") == [{"count": 0}]
+    store.close()
+
+
+def test_replace_and_conditional_delete(path):
+    store = TokenStore(path)
+    token = store.add_token("gw", "old", refresh_token="refresh", expires_at=NOW)
+    assert store.replace_token(token["id"], "new", None, NOW + 3600)["access_token"] == "new"
+    assert store.delete_unchanged_tokens({token["id"]: "old"}) == []
+    assert store.delete_unchanged_tokens({token["id"]: "new"}) == [token["id"]]
+    assert store.replace_token(token["id"], "newer", None, None) is None
+    store.close()
+
+
+def test_dead_tokens_leave_refreshable_tokens_to_the_scheduler(path):
+    store = TokenStore(path)
+    now = time.time()
+    expired = store.add_token("gw", "expired", expires_at=now - 1)
+    store.add_token("gw", "refreshable", refresh_token="refresh", expires_at=now - 1)
+    store.add_token("gw", "current", expires_at=now + 3600)
+    assert [token["id"] for token in store.dead_tokens(now)] == [expired["id"]]
+    assert len(store.dead_tokens(now + 1, max_age=0)) == 3
+    store.close()
+
+
+def test_page_sorts_filters_and_reports_the_last_row(path):
+    store = TokenStore(path)
+    store.add_tokens([{"api_gateway": "gw", "access_token": f"token-{i}", "expires_at": None if i == 2 else NOW + i}
+                      for i in range(5)])
+    rows, last_row = store.page("access_tokens", 0, 3, [{"colId": "expires_at", "sort": "desc"}])
+    assert [row["access_token"] for row in rows] == ["token-4", "token-3", "token-1"] and last_row == -1
+    rows, last_row = store.page("access_tokens", 3, 10, [{"colId": "expires_at", "sort": "desc"}])
+    assert [row["access_token"] for row in rows] == ["token-0", "token-2"] and last_row == 5
+    rows, last_row = store.page("access_tokens", 0, 10, None,
+                                {"expires_at": {"filterType": "number", "type": "lessThan", "filter": NOW + 3}})
+    assert [row["access_token"] for row in rows] == ["token-0", "token-1"] and last_row == 2
+    assert "refresh_token" not in rows[0]
+    store.close()
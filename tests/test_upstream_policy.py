@@ -0,0 +1,181 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import upstream_policy
+from upstream_policy import CircuitBreaker, CircuitOpenError, TokenBucket, UpstreamPolicy
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(upstream_policy, "backoff", lambda attempt: 0.0)
+
+
+def respond(*statuses, headers=None):
+    """Request callable answering with the given statuses in turn."""
+    remaining = list(statuses)
+
+    async def request():
+        return httpx.Response(remaining.pop(0), headers=headers)
+    return request
+
+
+def test_bucket_allows_burst_then_throttles():
+    async def run():
+        bucket = TokenBucket(rate=50.0, burst=2)
+        start = time.monotonic()
+        for _ in range(2):
+            await bucket.acquire()
+        burst = time.monotonic() - start
+        for _ in range(2):
+            await bucket.acquire()
+        return burst, time.monotonic() - start
+
+    burst, total = asyncio.run(run())
+    assert burst < 0.01
+    assert total >= 0.035
+
+
+def test_bucket_pause_holds_requests():
+    async def run():
+        bucket = TokenBucket(rate=1000.0, burst=10)
+        bucket.pause(0.05)
+        start = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.045
+
+
+def test_breaker_opens_after_threshold_and_probes_once():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.02)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.03)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0 and breaker.allow()
+
+
+def test_breaker_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.02)
+    breaker.record_failure()
+    time.sleep(0.03)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.probing
+
+
+def test_breaker_release_frees_probe_slot():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.02)
+    breaker.record_failure()
+    time.sleep(0.03)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == "half_open" and breaker.allow()
+
+
+def test_send_retries_and_opens_circuit():
+    async def run():
+        policy = UpstreamPolicy(max_attempts=5)
+        response = await policy.send("clio", respond(503, 503, 503, 503, 503))
+        assert response.status_code == 503
+        assert policy.breakers["clio"].state == "open"
+        with pytest.raises(CircuitOpenError):
+            await policy.send("clio", respond(200))
+
+    asyncio.run(run())
+
+
+def test_send_retries_after_429_without_failing():
+    async def run():
+        policy = UpstreamPolicy(max_attempts=2)
+        response = await policy.send("clio", respond(429, 200, headers={"Retry-After": "0"}))
+        assert response.status_code == 200
+        assert policy.breakers["clio"].failures == 0
+
+    asyncio.run(run())
+
+
+def test_cancelled_probe_releases_half_open_slot():
+    async def run():
+        policy = UpstreamPolicy(max_attempts=5)
+        await policy.send("clio", respond(503, 503, 503, 503, 503))
+        breaker = policy.breakers["clio"]
+        breaker.opened_at -= breaker.reset_timeout
+
+        async def hang():
+            await asyncio.sleep(10)
+
+        probe = asyncio.create_task(policy.send("clio", hang))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert breaker.state == "half_open" and not breaker.probing
+
+        response = await policy.send("clio", respond(200))
+        assert response.status_code == 200 and breaker.state == "closed"
+
+    asyncio.run(run())
+
+
+def test_probe_error_reopens_circuit():
+    async def run():
+        policy = UpstreamPolicy(max_attempts=5)
+        await policy.send("clio", respond(503, 503, 503, 503, 503))
+        breaker = policy.breakers["clio"]
+        breaker.opened_at -= breaker.reset_timeout
+
+        async def undecodable():
+            raise httpx.DecodingError("bad gzip")
+
+        with pytest.raises(httpx.DecodingError):
+            await policy.send("clio", undecodable)
+        assert breaker.state == "open" and not breaker.probing
+
+    asyncio.run(run())
+
+
+def test_single_use_request_is_not_resent():
+    async def run():
+        policy = UpstreamPolicy(max_attempts=4)
+        response = await policy.send("clio", respond(503, 200), idempotent=False)
+        assert response.status_code == 503
+
+        sent = []
+
+        async def read_timeout():
+            sent.append(1)
+            raise httpx.ReadTimeout("no response")
+
+        with pytest.raises(httpx.ReadTimeout):
+            await policy.send("clio", read_timeout, idempotent=False)
+        assert len(sent) == 1
+
+    asyncio.run(run())
+
+
+def test_single_use_request_retries_connect_errors():
+    async def run():
+        policy = UpstreamPolicy(max_attempts=4)
+        attempts = []
+
+        async def connect_then_respond():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise httpx.ConnectError("refused")
+            return httpx.Response(200)
+
+        response = await policy.send("clio", connect_then_respond, idempotent=False)
+        assert response.status_code == 200 and len(attempts) == 3
+
+    asyncio.run(run())
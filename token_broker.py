@@ -0,0 +1,174 @@
+import heapq
+import math
+import secrets
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from token_store import TokenStore
+
+# Clio rate-limits each access token separately; budgets mirror that limit per window
+TOKEN_RATE_LIMIT = 50
+RATE_WINDOW = 60.0
+# Tokens with fewer requests left than this are skipped while another token has more
+RATE_RESERVE = 5
+
+# Leases not released within this time are reclaimed
+LEASE_TTL = 60.0
+
+STRATEGIES = ("round_robin", "lru")
+
+
+def parse_usage_report(rate_limit_remaining: Any, retry_after: Any) -> Tuple[Optional[int], Optional[float]]:
+    """Coerce reported rate-limit headers (numbers or header strings); raises ValueError if they are not valid."""
+    if isinstance(rate_limit_remaining, bool) or isinstance(retry_after, bool):
+        raise ValueError("Rate-limit values must be numbers")
+    if rate_limit_remaining is not None:
+        try:
+            rate_limit_remaining = int(str(rate_limit_remaining).strip())
+        except ValueError:
+            raise ValueError(f"rate_limit_remaining must be an integer: {rate_limit_remaining!r}") from None
+        if rate_limit_remaining < 0:
+            raise ValueError(f"rate_limit_remaining must not be negative: {rate_limit_remaining}")
+    if retry_after is not None:
+        try:
+            retry_after = float(str(retry_after).strip())
+        except ValueError:
+            raise ValueError(f"retry_after must be a number of seconds: {retry_after!r}") from None
+        if not math.isfinite(retry_after) or retry_after < 0:
+            raise ValueError(f"retry_after must be a non-negative number of seconds: {retry_after}")
+    return rate_limit_remaining, retry_after
+
+
+class TokenUsage:
+    """Request budget, rate-limit pause and in-flight leases of one token."""
+
+    __slots__ = ("window_start", "used", "blocked_until", "last_leased", "in_flight")
+
+    def __init__(self) -> None:
+        self.window_start = 0.0
+        self.used = 0
+        self.blocked_until = 0.0
+        self.last_leased = 0.0
+        self.in_flight = 0
+
+    def remaining(self, now: float, limit: int, window: float) -> int:
+        if now - self.window_start >= window:
+            self.window_start = now
+            self.used = 0
+        return 0 if now < self.blocked_until else limit - self.used
+
+    def available_at(self, window: float) -> float:
+        return max(self.blocked_until, self.window_start + window)
+
+
+class TokenBroker:
+    """Leases a gateway's tokens to downstream jobs so their requests are spread across every token."""
+
+    def __init__(self, store: TokenStore, rate_limit: int = TOKEN_RATE_LIMIT, window: float = RATE_WINDOW,
+                 reserve: int = RATE_RESERVE, lease_ttl: float = LEASE_TTL) -> None:
+        self.store = store
+        self.rate_limit = rate_limit
+        self.window = window
+        self.reserve = reserve
+        self.lease_ttl = lease_ttl
+        self.usage: Dict[int, TokenUsage] = {}
+        self.leases: Dict[str, Tuple[int, str]] = {}  # lease id -> (token id, gateway)
+        self.expiry_heap: List[Tuple[float, str]] = []
+        self.cursors: Dict[str, int] = {}
+        self.candidates: Dict[str, List[Dict[str, Any]]] = {}
+        store.add_listener(self.handle_change)
+
+    def handle_change(self, table: str, action: str, rows: List[Dict[str, Any]]) -> None:
+        if table != "access_tokens":
+            return
+        for row in rows:
+            self.candidates.pop(row["api_gateway"], None)
+            if action == "removed":
+                self.usage.pop(row["id"], None)
+
+    def _candidates(self, api_gateway: str, now: float) -> List[Dict[str, Any]]:
+        """Usable tokens of a gateway in ID order, loaded once and refreshed by store changes."""
+        tokens = self.candidates.get(api_gateway)
+        if tokens is None:
+            tokens = self.candidates[api_gateway] = [
+                token for token in self.store.tokens(api_gateway=api_gateway) if token["status"] != "invalid"]
+        return [token for token in tokens if token["expires_at"] is None or token["expires_at"] > now]
+
+    def _reap(self, now: float) -> None:
+        """Reclaim expired leases; entries of released leases are skipped."""
+        while self.expiry_heap and self.expiry_heap[0][0] <= now:
+            self._end(heapq.heappop(self.expiry_heap)[1])
+
+    def _end(self, lease_id: str) -> Optional[TokenUsage]:
+        lease = self.leases.pop(lease_id, None)
+        if lease is None:
+            return None
+        usage = self.usage.get(lease[0])
+        if usage is not None:
+            usage.in_flight -= 1
+        return usage
+
+    def lease(self, api_gateway: str, requests: int = 1, strategy: str = "round_robin") -> Tuple[Optional[Dict[str, Any]], float]:
+        """Lease a token with budget for `requests` calls.
+
+        Returns (lease, 0) or, when every token is exhausted, (None, seconds until one has budget again).
+        """
+        now = time.time()
+        self._reap(now)
+        tokens = self._candidates(api_gateway, now)
+        if not tokens:
+            return None, 0.0
+
+        usages = [self.usage.setdefault(token["id"], TokenUsage()) for token in tokens]
+        remaining = [usage.remaining(now, self.rate_limit, self.window) for usage in usages]
+        eligible = [i for i, left in enumerate(remaining) if left >= requests]
+        if not eligible:
+            return None, max(0.0, min(usage.available_at(self.window) for usage in usages) - now)
+        # Keep tokens close to their limit in reserve while others have room
+        roomy = [i for i in eligible if remaining[i] - requests >= self.reserve]
+        eligible = roomy or eligible
+
+        if strategy == "lru":
+            choice = min(eligible, key=lambda i: (usages[i].last_leased, usages[i].in_flight))
+        else:
+            cursor = self.cursors.get(api_gateway, -1)
+            choice = next((i for i in eligible if tokens[i]["id"] > cursor), eligible[0])
+            self.cursors[api_gateway] = tokens[choice]["id"]
+
+        token, usage = tokens[choice], usages[choice]
+        usage.used += requests
+        usage.last_leased = now
+        usage.in_flight += 1
+        lease_id = secrets.token_urlsafe(12)
+        self.leases[lease_id] = (token["id"], api_gateway)
+        heapq.heappush(self.expiry_heap, (now + self.lease_ttl, lease_id))
+        return {
+            "lease_id": lease_id,
+            "token_id": token["id"],
+            "access_token": token["access_token"],
+            "lease_expires_at": now + self.lease_ttl,
+            "remaining": remaining[choice] - requests,
+        }, 0.0
+
+    def release(self, lease_id: str, rate_limit_remaining: Any = None, retry_after: Any = None) -> bool:
+        """End a lease, optionally reporting the rate-limit headers Clio returned for the token.
+
+        Raises ValueError, leaving the lease active, if a reported value is not valid.
+        """
+        rate_limit_remaining, retry_after = parse_usage_report(rate_limit_remaining, retry_after)
+        usage = self._end(lease_id)
+        if usage is None:
+            return False
+        if rate_limit_remaining is not None:
+            # Clio's own count wins over the local estimate (other clients may share the token)
+            usage.used = max(usage.used, self.rate_limit - rate_limit_remaining)
+        if retry_after:
+            usage.blocked_until = time.time() + retry_after
+        return True
+
+    def in_flight(self) -> Dict[str, int]:
+        """Number of active leases per gateway."""
+        counts: Dict[str, int] = {}
+        for _, api_gateway in self.leases.values():
+            counts[api_gateway] = counts.get(api_gateway, 0) + 1
+        return counts
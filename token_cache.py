@@ -0,0 +1,53 @@
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from token_store import TokenStore
+
+# Fields returned to services by the token-vending API
+PUBLIC_FIELDS = ("id", "api_gateway", "access_token", "expires_at")
+
+
+class TokenCache:
+    """Hot in-memory cache of the pre-serialized current token (and ETag) per API gateway."""
+
+    def __init__(self, store: TokenStore) -> None:
+        self.store = store
+        # Only hits are kept, so names of unknown gateways never pile up here
+        self.entries: Dict[str, Tuple[bytes, str, Optional[float]]] = {}
+        store.add_listener(self.handle_change)
+
+    def get(self, api_gateway: str) -> Optional[Tuple[bytes, str]]:
+        """Return (json_body, etag) for the gateway's current token, or None if it has none."""
+        entry = self.entries.get(api_gateway)
+        if entry is not None:
+            body, etag, expires_at = entry
+            if expires_at is None or expires_at > time.time():
+                return body, etag
+            del self.entries[api_gateway]
+        entry = self._load(api_gateway)
+        if entry is None:
+            return None
+        self.entries[api_gateway] = entry
+        return entry[:2]
+
+    def _load(self, api_gateway: str) -> Optional[Tuple[bytes, str, Optional[float]]]:
+        token = self.store.current_token(api_gateway)
+        if token is None:
+            return None
+        body = json.dumps({field: token[field] for field in PUBLIC_FIELDS}).encode()
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        return body, etag, token["expires_at"]
+
+    def invalidate(self, api_gateway: Optional[str] = None) -> None:
+        """Drop one gateway's entry, or every entry when no gateway is given."""
+        if api_gateway is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(api_gateway, None)
+
+    def handle_change(self, table: str, action: str, rows: List[Dict[str, Any]]) -> None:
+        if table == "access_tokens":
+            for row in rows:
+                self.invalidate(row["api_gateway"])
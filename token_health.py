@@ -0,0 +1,54 @@
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional, Tuple
+
+from clio_oauth import ClioOAuthClient, PROBE_CONCURRENCY
+from clio_regions import endpoints
+from journal import acting_as
+from token_store import TokenStore
+
+# Results younger than this are reused instead of probing Clio again
+HEALTH_TTL = 15 * 60
+
+# Statuses: "valid" and "invalid" (rejected by Clio) come from a probe, "error" when Clio
+# could not be reached; "expired" and "no_gateway" (gateway deleted) are decided locally
+
+
+class TokenHealthChecker:
+    """Probes stored tokens against Clio and records each token's status and check time in the store."""
+
+    def __init__(self, store: TokenStore, oauth_client: ClioOAuthClient, probe_url: Optional[str] = None,
+                 ttl: float = HEALTH_TTL) -> None:
+        self.store = store
+        self.oauth_client = oauth_client
+        # None probes each token against the API of its own region
+        self.probe_url = probe_url
+        self.ttl = ttl
+
+    async def validate_all(self, concurrency: int = PROBE_CONCURRENCY, force: bool = False,
+                           on_progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+        """Check every token whose last result is older than the TTL and return the number of tokens per status."""
+        now = time.time()
+        gateway_ids = {gateway["id"] for gateway in self.store.gateways()}
+        statuses: Dict[int, str] = {}
+        to_probe: Dict[int, Tuple[str, str]] = {}
+
+        for token in self.store.tokens():
+            if not force and token["checked_at"] and now - token["checked_at"] < self.ttl:
+                continue
+            # Expired tokens and tokens of deleted gateways are classified without a request
+            if token["expires_at"] and token["expires_at"] <= now:
+                statuses[token["id"]] = "expired"
+            elif token["gateway_id"] is not None and token["gateway_id"] not in gateway_ids:
+                statuses[token["id"]] = "no_gateway"
+            else:
+                to_probe[token["id"]] = (self.probe_url or endpoints(token["region"]).probe_url, token["access_token"])
+
+        if to_probe:
+            statuses.update(await self.oauth_client.probe_many(to_probe, concurrency, on_progress))
+        if statuses:
+            # One transaction for the whole run
+            with acting_as("health_check"):
+                self.store.record_health(statuses, time.time())
+        return dict(Counter(statuses.values()))
+
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from clio_oauth import ClioOAuthClient, DEAUTHORIZE_CONCURRENCY
+from clio_regions import endpoints
+from journal import acting_as
+from token_store import TokenStore
+
+log = logging.getLogger(__name__)
+
+# How often expired and over-age tokens are looked up and purged
+PURGE_INTERVAL = 60 * 60
+
+
+class TokenReaper:
+    """Periodically deauthorizes tokens past their expiry or a maximum age and purges them in one commit.
+
+    Expired tokens are purged even if Clio rejects the deauthorization (they no
+    longer work anyway); over-age tokens that could not be deauthorized are kept
+    and retried on the next run. Expired tokens with a refresh token are left to
+    the refresh scheduler, and a token rotated while it was being revoked is kept.
+    """
+
+    def __init__(self, store: TokenStore, oauth_client: ClioOAuthClient, deauthorize_url: Optional[str] = None,
+                 max_age: Optional[float] = None, interval: float = PURGE_INTERVAL,
+                 concurrency: int = DEAUTHORIZE_CONCURRENCY) -> None:
+        self.store = store
+        self.oauth_client = oauth_client
+        # None deauthorizes each token at its own region
+        self.deauthorize_url = deauthorize_url
+        self.max_age = max_age
+        self.interval = interval
+        self.concurrency = concurrency
+        self._task: Optional[asyncio.Task] = None
+
+    async def purge(self) -> Dict[str, int]:
+        """Run one purge and return the number of expired, over-age and kept tokens."""
+        now = time.time()
+        dead = self.store.dead_tokens(now, self.max_age)
+        if not dead:
+            return {}
+        deauthorized = await self.oauth_client.deauthorize_many(
+            {token["id"]: (self.deauthorize_url or endpoints(token["region"]).deauthorize_url, token["access_token"])
+             for token in dead}, self.concurrency)
+
+        expired = {token["id"] for token in dead
+                   if token["expires_at"] is not None and token["expires_at"] <= now and not token["refresh_token"]}
+        over_age = {token["id"] for token in dead} - expired
+        purged = expired | (over_age & deauthorized)
+        deleted = set()
+        if purged:
+            # Only rows still holding the revoked token are deleted (the scheduler may have rotated some meanwhile)
+            with acting_as("token_reaper"):
+                deleted = set(self.store.delete_unchanged_tokens(
+                    {token["id"]: token["access_token"] for token in dead if token["id"] in purged}))
+        counts = {"expired": len(expired & deleted), "max_age": len(over_age & deleted),
+                  "kept": len({token["id"] for token in dead} - deleted)}
+        log.info("Purged %(expired)s expired and %(max_age)s over-age tokens, kept %(kept)s", counts)
+        return counts
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.purge()
+            except Exception:
+                log.exception("Purging dead tokens failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
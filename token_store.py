@@ -0,0 +1,559 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from metrics import STORAGE_FLUSH_BYTES, STORAGE_FLUSH_LATENCY
+from grid_model import resolve_relative_fields
+
+DATABASE_PATH = os.path.join(".nicegui", "clio_tokens.db")
+
+# How often shared stores look for changes made by other workers, and how long changes are kept
+CHANGE_POLL_INTERVAL = 0.5
+CHANGE_LOG_RETENTION = 60 * 60
+
+GATEWAY_COLUMNS = ["ID", "Name", "Client Id", "Client Secret", "Region"]
+
+# Rows read or written per transaction by bulk import and export
+BULK_BATCH_SIZE = 500
+
+# Listeners are called as listener(table, action, rows) after each committed change
+ChangeListener = Callable[[str, str, List[Dict[str, Any]]], None]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS api_gateways (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    client_id TEXT NOT NULL,
+    client_secret TEXT NOT NULL,
+    region TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_api_gateways_client_id ON api_gateways (client_id);
+
+CREATE TABLE IF NOT EXISTS access_tokens (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    gateway_id INTEGER,
+    api_gateway TEXT NOT NULL,
+    access_token TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    refresh_token TEXT,
+    expires_at REAL,
+    status TEXT,
+    checked_at REAL,
+    region TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_access_tokens_gateway ON access_tokens (api_gateway, created_at);
+CREATE INDEX IF NOT EXISTS idx_access_tokens_created_at ON access_tokens (created_at);
+
+CREATE TABLE IF NOT EXISTS oauth_states (
+    state TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_oauth_states_expires_at ON oauth_states (expires_at);
+
+CREATE TABLE IF NOT EXISTS change_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    action TEXT NOT NULL,
+    rows TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# Columns the paginated grids show, sort and filter on, per table; no other column (such as
+# refresh_token) is ever sent to a browser
+GRID_FIELDS = {
+    "api_gateways": ("id", "name", "client_id", "client_secret", "region"),
+    "access_tokens": ("id", "api_gateway", "access_token", "created_at", "expires_at", "status", "checked_at", "region"),
+}
+
+# AG Grid filter types mapped to SQL operators and LIKE patterns
+TEXT_FILTERS = {
+    "contains": ("LIKE", "%{}%"),
+    "notContains": ("NOT LIKE", "%{}%"),
+    "startsWith": ("LIKE", "{}%"),
+    "endsWith": ("LIKE", "%{}"),
+    "equals": ("=", "{}"),
+    "notEqual": ("!=", "{}"),
+}
+NUMBER_FILTERS = {
+    "equals": "=",
+    "notEqual": "!=",
+    "lessThan": "<",
+    "lessThanOrEqual": "<=",
+    "greaterThan": ">",
+    "greaterThanOrEqual": ">=",
+}
+
+# Columns added after the first release, created on older databases at startup
+MIGRATIONS = {
+    "api_gateways": {"region": "TEXT"},
+    "access_tokens": {"refresh_token": "TEXT", "expires_at": "REAL", "status": "TEXT", "checked_at": "REAL", "region": "TEXT"},
+}
+
+
+class TokenStore:
+    """SQLite-backed store for API gateways, access tokens and (when shared) OAuth states.
+
+    With shared=True several worker processes can use the same database file:
+    every change is also written to a change log in the same transaction, and
+    watch_changes() replays other workers' changes to the local listeners.
+    """
+
+    def __init__(self, path: str = DATABASE_PATH, shared: bool = False) -> None:
+        self.path = path
+        self.shared = shared
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.listeners: List[ChangeListener] = []
+        self.origin = uuid.uuid4().hex
+        # True while changes made by other workers are being delivered to the listeners
+        self.replaying = False
+        self._changes: List[Tuple[str, str, List[Dict[str, Any]]]] = []
+        self._watcher: Optional[asyncio.Task] = None
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        # Truncate the WAL whenever it restarts so its growth measures bytes written per transaction
+        self.connection.execute("PRAGMA journal_size_limit=0")
+        self.connection.executescript(SCHEMA)
+        self._migrate()
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_access_tokens_expires_at ON access_tokens (expires_at)")
+        self.last_change_id = self.connection.execute("SELECT COALESCE(MAX(id), 0) FROM change_log").fetchone()[0]
+        self.data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def _migrate(self) -> None:
+        for table, columns in MIGRATIONS.items():
+            existing = {row["name"] for row in self.connection.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in columns.items():
+                if column not in existing:
+                    self.connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        self.connection.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def add_listener(self, listener: ChangeListener) -> None:
+        """Register a callback for committed inserts ("added"), updates ("updated") and deletes ("removed")."""
+        self.listeners.append(listener)
+
+    def _notify(self, table: str, action: str, rows: List[Dict[str, Any]]) -> None:
+        if rows:
+            for listener in self.listeners:
+                listener(table, action, rows)
+
+    def _changed(self, table: str, action: str, rows: List[Dict[str, Any]]) -> None:
+        """Queue a change from inside a write transaction; listeners run after it commits."""
+        if rows:
+            self._changes.append((table, action, rows))
+
+    def _wal_size(self) -> int:
+        try:
+            return os.path.getsize(self.path + "-wal")
+        except OSError:
+            return 0
+
+    @contextmanager
+    def _write(self, operation: str) -> Iterator[None]:
+        """Run one write transaction under the lock and record its duration and WAL growth."""
+        with self.lock:
+            wal_before = self._wal_size()
+            start = time.perf_counter()
+            self._changes = []
+            try:
+                with self.connection:
+                    yield
+                    if self.shared and self._changes:
+                        # Other workers pick these up through watch_changes()
+                        self.connection.executemany(
+                            "INSERT INTO change_log (origin, table_name, action, rows, created_at) VALUES (?, ?, ?, ?, ?)",
+                            [(self.origin, table, action, json.dumps(rows), time.time())
+                             for table, action, rows in self._changes])
+                changes = self._changes
+            finally:
+                self._changes = []
+            STORAGE_FLUSH_LATENCY.observe(time.perf_counter() - start, operation)
+            wal_after = self._wal_size()
+            # A smaller WAL means it was reset after a checkpoint, so all of it is new
+            STORAGE_FLUSH_BYTES.observe(wal_after - wal_before if wal_after >= wal_before else wal_after, operation)
+        for change in changes:
+            self._notify(*change)
+
+    def _query(self, sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [dict(row) for row in self.connection.execute(sql, tuple(params))]
+
+    # API gateways
+
+    def gateways(self) -> List[Dict[str, Any]]:
+        """Return every API gateway ordered by ID."""
+        return self._query("SELECT id, name, client_id, client_secret, region FROM api_gateways ORDER BY id")
+
+    def get_gateway(self, gateway_id: int) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT id, name, client_id, client_secret, region FROM api_gateways WHERE id = ?", (gateway_id,))
+        return rows[0] if rows else None
+
+    def add_gateway(self, name: str, client_id: str, client_secret: str, region: Optional[str] = None) -> Dict[str, Any]:
+        """Insert a gateway and return it with its new primary key."""
+        with self._write("add_gateway"):
+            cursor = self.connection.execute(
+                "INSERT INTO api_gateways (name, client_id, client_secret, region) VALUES (?, ?, ?, ?)",
+                (name, client_id, client_secret, region))
+            gateway = {"id": cursor.lastrowid, "name": name, "client_id": client_id, "client_secret": client_secret,
+                       "region": region}
+            self._changed("api_gateways", "added", [gateway])
+        return gateway
+
+    def update_gateway(self, row: Dict[str, Any]) -> None:
+        self.update_gateways([row])
+
+    def update_gateways(self, rows: List[Dict[str, Any]]) -> None:
+        """Write several edited gateways in a single transaction; gateways deleted meanwhile are skipped."""
+        with self._write("update_gateways"):
+            updated = []
+            for row in rows:
+                cursor = self.connection.execute(
+                    "UPDATE api_gateways SET name = ?, client_id = ?, client_secret = ?, region = ? WHERE id = ?",
+                    (row["name"], row["client_id"], row["client_secret"], row.get("region") or None, row["id"]))
+                if cursor.rowcount:
+                    updated.append(row)
+            self._changed("api_gateways", "updated", updated)
+
+    def delete_gateway(self, gateway_id: int) -> None:
+        with self._write("delete_gateway"):
+            removed = [dict(row) for row in self.connection.execute("SELECT * FROM api_gateways WHERE id = ?", (gateway_id,))]
+            self.connection.execute("DELETE FROM api_gateways WHERE id = ?", (gateway_id,))
+            self._changed("api_gateways", "removed", removed)
+
+    # Access tokens
+
+    def tokens(self, api_gateway: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return stored access tokens, optionally only those of one gateway."""
+        if api_gateway is None:
+            return self._query("SELECT * FROM access_tokens ORDER BY id")
+        return self._query("SELECT * FROM access_tokens WHERE api_gateway = ? ORDER BY created_at", (api_gateway,))
+
+    def token_gateways(self) -> List[str]:
+        """Return the distinct gateway names that own at least one token."""
+        return [row["api_gateway"] for row in self._query("SELECT DISTINCT api_gateway FROM access_tokens ORDER BY api_gateway")]
+
+    def current_token(self, api_gateway: str) -> Optional[Dict[str, Any]]:
+        """Return the newest unexpired token of a gateway that has not failed a health check."""
+        rows = self._query(
+            "SELECT * FROM access_tokens WHERE api_gateway = ? AND (expires_at IS NULL OR expires_at > ?) "
+            "AND (status IS NULL OR status != 'invalid') "
+            "ORDER BY created_at DESC LIMIT 1", (api_gateway, time.time()))
+        return rows[0] if rows else None
+
+    def token_counts(self) -> Dict[str, int]:
+        """Return the number of stored tokens per gateway name."""
+        rows = self._query("SELECT api_gateway, COUNT(*) AS count FROM access_tokens GROUP BY api_gateway")
+        return {row["api_gateway"]: row["count"] for row in rows}
+
+    def token_count(self) -> int:
+        return self._query("SELECT COUNT(*) AS count FROM access_tokens")[0]["count"]
+
+    def get_token(self, token_id: int) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT * FROM access_tokens WHERE id = ?", (token_id,))
+        return rows[0] if rows else None
+
+    def refreshable_tokens(self) -> List[Dict[str, Any]]:
+        """Return tokens that have a refresh token and a known expiry."""
+        return self._query("SELECT * FROM access_tokens WHERE refresh_token IS NOT NULL AND expires_at IS NOT NULL")
+
+    def dead_tokens(self, now: float, max_age: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Return tokens expired by `now` and, with max_age, tokens issued more than max_age seconds ago.
+
+        Expired tokens that have a refresh token are left to the refresh scheduler.
+        """
+        # Each branch is answered from its own index
+        sql, params = "SELECT * FROM access_tokens WHERE expires_at <= ? AND refresh_token IS NULL", [now]
+        if max_age is not None:
+            sql += " UNION SELECT * FROM access_tokens WHERE created_at < ?"
+            params.append(now - max_age)
+        return self._query(f"{sql} ORDER BY id", params)
+
+    def add_token(self, api_gateway: str, access_token: str, gateway_id: Optional[int] = None,
+                  refresh_token: Optional[str] = None, expires_at: Optional[float] = None,
+                  region: Optional[str] = None) -> Dict[str, Any]:
+        """Insert a token in its own transaction and return the stored row."""
+        created_at = time.time()
+        with self._write("add_token"):
+            cursor = self.connection.execute(
+                "INSERT INTO access_tokens (gateway_id, api_gateway, access_token, created_at, refresh_token, expires_at, region) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (gateway_id, api_gateway, access_token, created_at, refresh_token, expires_at, region))
+            token = {"id": cursor.lastrowid, "gateway_id": gateway_id, "api_gateway": api_gateway,
+                     "access_token": access_token, "created_at": created_at,
+                     "refresh_token": refresh_token, "expires_at": expires_at, "status": None, "checked_at": None,
+                     "region": region}
+            self._changed("access_tokens", "added", [token])
+        return token
+
+    def replace_token(self, token_id: int, access_token: str, refresh_token: Optional[str],
+                      expires_at: Optional[float]) -> Optional[Dict[str, Any]]:
+        """Atomically swap in a rotated token; returns None if the token was deleted meanwhile."""
+        with self._write("replace_token"):
+            cursor = self.connection.execute(
+                # A rotated token has not been health-checked yet
+                "UPDATE access_tokens SET access_token = ?, refresh_token = ?, expires_at = ?, "
+                "status = NULL, checked_at = NULL WHERE id = ?",
+                (access_token, refresh_token, expires_at, token_id))
+            if not cursor.rowcount:
+                return None
+            token = dict(self.connection.execute("SELECT * FROM access_tokens WHERE id = ?", (token_id,)).fetchone())
+            self._changed("access_tokens", "updated", [token])
+        return token
+
+    def record_health(self, statuses: Dict[int, str], checked_at: float) -> None:
+        """Store health-check results ({id: status}) in a single transaction."""
+        params = [(status, checked_at, token_id) for token_id, status in statuses.items()]
+        with self._write("record_health"):
+            self.connection.executemany("UPDATE access_tokens SET status = ?, checked_at = ? WHERE id = ?", params)
+            updated = [dict(row) for _, _, token_id in params
+                       for row in self.connection.execute("SELECT * FROM access_tokens WHERE id = ?", (token_id,))]
+            self._changed("access_tokens", "updated", updated)
+
+    def delete_tokens(self, token_ids: Iterable[int]) -> None:
+        """Delete tokens by primary key in a single transaction."""
+        params = [(token_id,) for token_id in token_ids]
+        with self._write("delete_tokens"):
+            removed = [dict(row) for token_id in params
+                       for row in self.connection.execute("SELECT * FROM access_tokens WHERE id = ?", token_id)]
+            self.connection.executemany("DELETE FROM access_tokens WHERE id = ?", params)
+            self._changed("access_tokens", "removed", removed)
+
+    def delete_unchanged_tokens(self, tokens: Dict[int, str]) -> List[int]:
+        """Delete tokens ({id: access_token}) only if they still hold that access token; returns the deleted ids.
+
+        A token rotated since it was read keeps its row, so a slow revoke never deletes its successor.
+        """
+        params = list(tokens.items())
+        with self._write("delete_tokens"):
+            removed = [dict(row) for token in params for row in self.connection.execute(
+                "SELECT * FROM access_tokens WHERE id = ? AND access_token = ?", token)]
+            self.connection.executemany("DELETE FROM access_tokens WHERE id = ? AND access_token = ?", params)
+            self._changed("access_tokens", "removed", removed)
+        return [row["id"] for row in removed]
+
+    # Bulk import and export
+
+    def iter_rows(self, table: str, batch_size: int = BULK_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+        """Yield every row of a table in ID order, reading one batch at a time."""
+        if table not in GRID_FIELDS:
+            raise ValueError(f"Unknown table: {table}")
+        last_id = 0
+        while True:
+            rows = self._query(f"SELECT * FROM {table} WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size))
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1]["id"]
+
+    def existing_values(self, table: str, field: str, values: Iterable[str]) -> Set[str]:
+        """Return which of the given values are already stored in a column (used to dedupe imports)."""
+        if field not in GRID_FIELDS.get(table, ()):
+            raise ValueError(f"Unknown column: {table}.{field}")
+        values = list(values)
+        if not values:
+            return set()
+        placeholders = ", ".join("?" * len(values))
+        return {row[field] for row in self._query(f"SELECT {field} FROM {table} WHERE {field} IN ({placeholders})", values)}
+
+    def add_gateways(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert several gateways in a single transaction and return them with their primary keys."""
+        with self._write("add_gateways"):
+            added = []
+            for row in rows:
+                cursor = self.connection.execute(
+                    "INSERT INTO api_gateways (name, client_id, client_secret, region) VALUES (?, ?, ?, ?)",
+                    (row["name"], row["client_id"], row["client_secret"], row.get("region")))
+                added.append({"id": cursor.lastrowid, "name": row["name"], "client_id": row["client_id"],
+                              "client_secret": row["client_secret"], "region": row.get("region")})
+            self._changed("api_gateways", "added", added)
+        return added
+
+    def add_tokens(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert several tokens in a single transaction and return the stored rows."""
+        now = time.time()
+        with self._write("add_tokens"):
+            added = []
+            for row in rows:
+                token = {"gateway_id": row.get("gateway_id"), "api_gateway": row["api_gateway"],
+                         "access_token": row["access_token"], "created_at": row.get("created_at") or now,
+                         "refresh_token": row.get("refresh_token"), "expires_at": row.get("expires_at"),
+                         "status": None, "checked_at": None, "region": row.get("region")}
+                cursor = self.connection.execute(
+                    "INSERT INTO access_tokens (gateway_id, api_gateway, access_token, created_at, refresh_token, expires_at, region) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (token["gateway_id"], token["api_gateway"], token["access_token"], token["created_at"],
+                     token["refresh_token"], token["expires_at"], token["region"]))
+                added.append({"id": cursor.lastrowid, **token})
+            self._changed("access_tokens", "added", added)
+        return added
+
+    # OAuth states (used instead of process memory when workers share the store)
+
+    def put_state(self, state: str, expires_at: float, data: Dict[str, Any]) -> None:
+        with self._write("put_state"):
+            self.connection.execute("INSERT OR REPLACE INTO oauth_states (state, expires_at, data) VALUES (?, ?, ?)",
+                                    (state, expires_at, json.dumps(data)))
+
+    def take_state(self, state: str) -> Optional[Dict[str, Any]]:
+        """Delete a state and return its data if it has not expired (validate-and-consume)."""
+        with self._write("take_state"):
+            row = self.connection.execute("SELECT expires_at, data FROM oauth_states WHERE state = ?", (state,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("DELETE FROM oauth_states WHERE state = ?", (state,))
+        return json.loads(row["data"]) if row["expires_at"] >= time.time() else None
+
+    def count_states(self) -> int:
+        return self._query("SELECT COUNT(*) AS count FROM oauth_states WHERE expires_at >= ?", (time.time(),))[0]["count"]
+
+    def purge_states(self) -> int:
+        """Delete expired states and return how many were removed."""
+        with self._write("purge_states"):
+            return self.connection.execute("DELETE FROM oauth_states WHERE expires_at < ?", (time.time(),)).rowcount
+
+    # Cross-worker change notification
+
+    def gateways_version(self) -> int:
+        """Return a value that moves whenever another connection commits, which covers gateway writes made elsewhere.
+
+        Writes through this store do not move it; listeners already see those.
+        """
+        with self.lock:
+            return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def poll_changes(self) -> int:
+        """Deliver changes committed by other workers to the local listeners; returns how many were delivered."""
+        with self.lock:
+            data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self.data_version:
+                return 0
+            self.data_version = data_version
+            rows = self.connection.execute(
+                "SELECT id, origin, table_name, action, rows FROM change_log WHERE id > ? ORDER BY id",
+                (self.last_change_id,)).fetchall()
+        changes = [row for row in rows if row["origin"] != self.origin]
+        if rows:
+            self.last_change_id = rows[-1]["id"]
+        self.replaying = True
+        try:
+            for change in changes:
+                self._notify(change["table_name"], change["action"], json.loads(change["rows"]))
+        finally:
+            self.replaying = False
+        return len(changes)
+
+    def prune_changes(self) -> None:
+        with self._write("prune_changes"):
+            self.connection.execute("DELETE FROM change_log WHERE created_at < ?", (time.time() - CHANGE_LOG_RETENTION,))
+
+    async def watch_changes(self, interval: float = CHANGE_POLL_INTERVAL) -> None:
+        last_prune = time.time()
+        while True:
+            await asyncio.sleep(interval)
+            self.poll_changes()
+            if time.time() - last_prune > CHANGE_LOG_RETENTION / 10:
+                self.prune_changes()
+                last_prune = time.time()
+
+    async def start(self) -> None:
+        """Start following other workers' changes (shared stores only)."""
+        if self.shared and self._watcher is None:
+            self._watcher = asyncio.create_task(self.watch_changes())
+
+    async def stop(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    # Paginated grids
+
+    def page(self, table: str, start: int, end: int, sort_model: Optional[List[Dict[str, str]]] = None,
+             filter_model: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Return one window of rows for an AG Grid infinite row model.
+
+        The second value is the total row count once the last window is reached,
+        or -1 while more rows remain, so no full COUNT is needed per request.
+        """
+        fields = GRID_FIELDS[table]
+        sort_model, filter_model = resolve_relative_fields(sort_model, filter_model, time.time())
+        clauses, params = [], []
+        for field, model in (filter_model or {}).items():
+            if field in fields:
+                clause = _filter_clause(field, model, params)
+                if clause:
+                    clauses.append(clause)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        order = [f"{sort['colId']} {'DESC' if sort.get('sort') == 'desc' else 'ASC'}"
+                 for sort in sort_model or [] if sort.get("colId") in fields]
+        order.append("id ASC")
+
+        limit = max(0, end - start)
+        rows = self._query(
+            f"SELECT {', '.join(fields)} FROM {table} {where} ORDER BY {', '.join(order)} LIMIT ? OFFSET ?",
+            [*params, limit, max(0, start)])
+        last_row = start + len(rows) if len(rows) < limit else -1
+        return rows, last_row
+
+    # Migration
+
+    def import_legacy(self, gateway_data: Optional[Dict[str, Any]], token_list: Optional[List[Dict[str, Any]]]) -> bool:
+        """Copy the old app.storage.general gateways and tokens into an empty store."""
+        if self._query("SELECT 1 FROM api_gateways LIMIT 1") or self._query("SELECT 1 FROM access_tokens LIMIT 1"):
+            return False
+        gateway_rows = (gateway_data or {}).get("rows", [])
+        with self._write("import_legacy"):
+            # Legacy rows are stored as [id, name, client_id, client_secret]
+            self.connection.executemany(
+                "INSERT INTO api_gateways (id, name, client_id, client_secret) VALUES (?, ?, ?, ?)",
+                [tuple(row[:4]) for row in gateway_rows])
+            self.connection.executemany(
+                "INSERT INTO access_tokens (api_gateway, access_token, created_at) VALUES (?, ?, ?)",
+                [(token.get("api_gateway") or "", token["access_token"], time.time()) for token in token_list or []])
+        return bool(gateway_rows or token_list)
+
+
+def _filter_clause(field: str, model: Dict[str, Any], params: List[Any]) -> Optional[str]:
+    """Translate one AG Grid column filter model into a parameterized SQL condition."""
+    if "conditions" in model:
+        parts = [_filter_clause(field, condition, params) for condition in model["conditions"]]
+        parts = [part for part in parts if part]
+        operator = " OR " if model.get("operator") == "OR" else " AND "
+        return f"({operator.join(parts)})" if parts else None
+
+    if model.get("filterType") == "number" and model.get("type") in NUMBER_FILTERS:
+        if model.get("filter") is None:
+            return None
+        params.append(model["filter"])
+        return f"{field} {NUMBER_FILTERS[model['type']]} ?"
+
+    if model.get("type") in TEXT_FILTERS and model.get("filter") not in (None, ""):
+        operator, pattern = TEXT_FILTERS[model["type"]]
+        params.append(pattern.format(model["filter"]))
+        return f"{field} {operator} ?"
+    return None
+
+
+def open_store(backend: str = "local", path: str = DATABASE_PATH, redis_url: Optional[str] = None):
+    """Open the store for a STORAGE_BACKEND setting: "local", "sqlite" (shared file) or "redis"."""
+    if backend == "redis":
+        from redis_store import RedisTokenStore
+        return RedisTokenStore(redis_url)
+    if backend not in ("local", "sqlite"):
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return TokenStore(path, shared=backend == "sqlite")
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+# Retries with exponential backoff and full jitter
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRY_AFTER_MAX = 120.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Errors raised before any byte of the request went out; the only ones a single-use request is retried on
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Per-host token bucket; raise it for mock servers or hosts with a higher quota
+RATE_LIMIT = float(os.getenv("CLIO_RATE_LIMIT", 20.0))  # requests per second
+RATE_BURST = int(os.getenv("CLIO_RATE_BURST", RATE_LIMIT))
+
+# Circuit breaker: open after consecutive failures, probe again after the reset timeout
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30.0
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Raised without contacting Clio while a host's circuit breaker is open."""
+
+
+class TokenBucket:
+    """Async token-bucket limiter that can also be paused by a Retry-After."""
+
+    def __init__(self, rate: float = RATE_LIMIT, burst: int = RATE_BURST) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def pause(self, delay: float) -> None:
+        """Hold back every request to this host for `delay` seconds."""
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        """Return whether a request may be sent; only one probe is let through when half-open."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def release(self) -> None:
+        """Give back a half-open probe slot whose request was abandoned without an answer."""
+        self.probing = False
+
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0.0), RETRY_AFTER_MAX)
+
+
+def backoff(attempt: int) -> float:
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class UpstreamPolicy:
+    """Rate limiting, retries and circuit breaking shared by every call to one upstream host."""
+
+    def __init__(self, max_attempts: int = MAX_ATTEMPTS, rate: float = RATE_LIMIT, burst: int = RATE_BURST) -> None:
+        self.max_attempts = max(1, max_attempts)
+        self.rate = rate
+        self.burst = burst
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    async def send(self, host: str, request: Callable[[], Awaitable[httpx.Response]],
+                   idempotent: bool = True) -> httpx.Response:
+        """Send a request under the host's policy; the last response or error is returned or raised.
+
+        A request that must not be repeated once Clio may have received it (an
+        authorization code exchange, a revoke) is sent with idempotent=False:
+        it is only retried on UNSENT_ERRORS and its first response is returned.
+        """
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.burst)
+            self.breakers[host] = CircuitBreaker()
+        bucket = self.buckets[host]
+        breaker = self.breakers[host]
+
+        for attempt in range(self.max_attempts):
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit breaker open for {host}")
+            last_attempt = attempt == self.max_attempts - 1
+
+            try:
+                await bucket.acquire()
+                response = await request()
+            except httpx.TransportError as error:
+                breaker.record_failure()
+                if last_attempt or not (idempotent or isinstance(error, UNSENT_ERRORS)):
+                    raise
+                await asyncio.sleep(backoff(attempt))
+                continue
+            except asyncio.CancelledError:
+                # The caller gave up; another request may probe the host
+                breaker.release()
+                raise
+            except BaseException:
+                breaker.record_failure()
+                raise
+
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                return response
+
+            if response.status_code == 429:
+                # Rate limiting is not a failure of the host, but every request to it must wait
+                delay = retry_after(response) or backoff(attempt)
+                bucket.pause(delay)
+                breaker.release()
+            else:
+                breaker.record_failure()
+                delay = backoff(attempt)
+            if last_attempt or not idempotent:
+                return response
+            await asyncio.sleep(delay)
@@ -0,0 +1,37 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+
+# Seconds without further edits before buffered rows are written
+EDIT_FLUSH_DELAY = 1.0
+
+
+class RowWriteBuffer:
+    """Coalesces row edits by ID and writes only the dirty rows after a quiet period."""
+
+    def __init__(self, write: Callable[[List[Dict[str, Any]]], None], delay: float = EDIT_FLUSH_DELAY) -> None:
+        self.write = write
+        self.delay = delay
+        self.dirty: Dict[Any, Dict[str, Any]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def mark_dirty(self, row: Dict[str, Any]) -> None:
+        """Buffer the latest version of a row and restart the debounce window."""
+        self.dirty[row["id"]] = row
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(self.delay, self.flush)
+
+    def discard(self, row_id: Any) -> None:
+        """Drop pending edits for a row that no longer exists."""
+        self.dirty.pop(row_id, None)
+
+    def flush(self) -> None:
+        """Write all dirty rows in one batch."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.dirty:
+            return
+        rows = list(self.dirty.values())
+        self.dirty.clear()
+        self.write(rows)